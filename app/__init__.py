@@ -37,6 +37,23 @@ app.register_blueprint(admin_bp, url_prefix='/admin')
 app.register_blueprint(cart_bp)
 app.register_blueprint(runner_bp, url_prefix='/runner')
 
+from app.columnar import reports_cli
+from app.delivery_analytics import analytics_cli
+from app.dispatch import dispatch_cli
+from app.events import events_cli
+from app.images import images_cli
+from app.order_summary import orders_cli
+from app.sales import sales_cli
+from app.tokens import tokens_cli
+app.cli.add_command(analytics_cli)
+app.cli.add_command(dispatch_cli)
+app.cli.add_command(events_cli)
+app.cli.add_command(images_cli)
+app.cli.add_command(orders_cli)
+app.cli.add_command(reports_cli)
+app.cli.add_command(sales_cli)
+app.cli.add_command(tokens_cli)
+
 
 if __name__ == '__main__':
     with app.app_context():
@@ -1,12 +1,27 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import get_jwt_identity
 from app.models import db, Address
+from app.authz import role_required
 
 address_bp = Blueprint('address', __name__)
 
+def _coordinates(data, address=None):
+    # Optional "latitude"/"longitude" (decimal degrees), used for dispatch.
+    lat = data.get('latitude', address.latitude if address else None)
+    lon = data.get('longitude', address.longitude if address else None)
+    if lat is None and lon is None:
+        return None, None
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must both be numbers")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("latitude/longitude out of range")
+    return lat, lon
+
 # Add new address
 @address_bp.route('/add_new_address', methods=['POST'])
-@jwt_required()
+@role_required()
 def add_address():
     user_id = get_jwt_identity()
     data = request.get_json() or {}
@@ -15,13 +30,20 @@ def add_address():
     if not all(field in data and data[field].strip() for field in required_fields):
         return jsonify({"error": "All address fields are required"}), 400
 
+    try:
+        latitude, longitude = _coordinates(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     new_address = Address(
         user_id=user_id,
         street=data['street'].strip(),
         city=data['city'].strip(),
         state=data['state'].strip(),
         zip_code=data['zip_code'].strip(),
-        country=data['country'].strip()
+        country=data['country'].strip(),
+        latitude=latitude,
+        longitude=longitude
     )
     db.session.add(new_address)
     db.session.commit()
@@ -42,7 +64,7 @@ def add_address():
 
 # Get all addresses of the logged-in user
 @address_bp.route('/getall_addresses', methods=['GET'])
-@jwt_required()
+@role_required()
 def get_user_addresses():
     user_id = get_jwt_identity()
     addresses = Address.query.filter_by(user_id=user_id).all()
@@ -55,7 +77,9 @@ def get_user_addresses():
             "city": addr.city,
             "state": addr.state,
             "zip_code": addr.zip_code,
-            "country": addr.country
+            "country": addr.country,
+            "latitude": addr.latitude,
+            "longitude": addr.longitude
         })
 
     return jsonify({"addresses": result}), 200
@@ -67,7 +91,7 @@ def get_user_addresses():
 
 # Update an address
 @address_bp.route('/update_address/<int:address_id>', methods=['PUT'])
-@jwt_required()
+@role_required()
 def update_address(address_id):
     user_id = get_jwt_identity()
     address = Address.query.filter_by(id=address_id, user_id=user_id).first()
@@ -77,6 +101,11 @@ def update_address(address_id):
 
     data = request.get_json() or {}
 
+    try:
+        address.latitude, address.longitude = _coordinates(data, address)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Only update if a field is provided
     address.street = data.get('street', address.street)
     address.city = data.get('city', address.city)
@@ -96,7 +125,7 @@ def update_address(address_id):
 
 # Delete an address
 @address_bp.route('/delete_address/<int:address_id>', methods=['DELETE'])
-@jwt_required()
+@role_required()
 def delete_address(address_id):
     user_id = get_jwt_identity()
     address = Address.query.filter_by(id=address_id, user_id=user_id).first()
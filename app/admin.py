@@ -1,27 +1,26 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, User
+from sqlalchemy import func
+from app.models import db, User, Product, ProductSales
 from app import app  
+from app.authz import role_required, user_changed, user_removed
+from app.delivery_boy import invalidate_runner_list
+from app.pagination import parse_date_range, parse_limit
+from app.sales import BACKFILL_SUFFIX, rollup_marks
+from app.columnar import REPORTS, export_marks, pa
+from app.events import dispatcher, retry_dead
+from app.ratelimit import limiter
 
 # User Management:
 
 admin_bp = Blueprint('admin', __name__)
 
-def is_admin(user_id):
-    user = User.query.get(user_id)
-    return user and user.role == "admin"
-
 # (register admin) is in auth.py
 
 
 # Get all users
 @admin_bp.route('/users', methods=['GET'])
-@jwt_required()
+@role_required("admin")
 def get_all_users():
-    current_user_id = get_jwt_identity()
-    if not is_admin(current_user_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     users = User.query.all()
     user_list = []
     for user in users:
@@ -40,12 +39,8 @@ def get_all_users():
 # Change user status (active/inactive)
 # This endpoint allows an admin to change the status of a user (active/inactive).
 @admin_bp.route('/users/<int:user_id>/status', methods=['PUT'])
-@jwt_required()
+@role_required("admin")
 def update_user_status(user_id):
-    current_user_id = get_jwt_identity()
-    if not is_admin(current_user_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -57,19 +52,17 @@ def update_user_status(user_id):
         return jsonify({"error": "Invalid 'isActive' value. It must be true or false."}), 400
 
     user.isActive = isActive
+    user_changed(user)
     db.session.commit()
+    invalidate_runner_list()
 
     return jsonify({"message": f"User status updated to {'Active' if isActive else 'Inactive'}."}), 200
 
 
 # display user details
 @admin_bp.route('/users/<int:user_id>', methods=['GET'])
-@jwt_required()
+@role_required("admin")
 def user_details(user_id):
-    current_user_id = get_jwt_identity()
-    if not is_admin(current_user_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -86,22 +79,18 @@ def user_details(user_id):
 
 # update user role
 @admin_bp.route('/users/<int:user_id>/promote', methods=['PUT'])
-@jwt_required()
+@role_required("admin")
 def promote_user(user_id):
-    current_user_id = get_jwt_identity()
-
-    # Ensure only an admin can promote another user
-    if not is_admin(current_user_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
 
     # Promote the user to admin
     user.role = "admin"
+    user_changed(user)
 
     db.session.commit()
+    invalidate_runner_list()
     return jsonify({"message": f"User {user_id} has been promoted to admin."}), 200
 # http://127.0.0.1:5000/admin/users/8/promote
 
@@ -109,18 +98,116 @@ def promote_user(user_id):
 
 # delete a user
 @admin_bp.route('/users/<int:user_id>', methods=['DELETE'])
-@jwt_required()
+@role_required("admin")
 def delete_user(user_id):
-    current_user_id = get_jwt_identity()
-    if not is_admin(current_user_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
 
     db.session.delete(user)
     db.session.commit()
+    user_removed(user_id)
+    invalidate_runner_list()
     return jsonify({"message": "User deleted successfully"}), 200
 # http://127.0.0.1:5000/admin/users/8
 
+
+
+# Sales report, read only from the ProductSales rollup (flask sales rollup)
+# ?from=&to= (days, inclusive)  ?product_id=  ?group=product|day  ?limit=
+@admin_bp.route('/sales', methods=['GET'])
+@role_required("admin")
+def sales_report():
+    group = request.args.get('group', 'product')
+    if group not in ('product', 'day'):
+        return jsonify({"error": "group must be 'product' or 'day'"}), 400
+    try:
+        start, end = parse_date_range(request.args)
+        limit = parse_limit(request.args.get('limit'), default=100, maximum=1000)
+        product_id = request.args.get('product_id', type=int)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    qty = func.sum(ProductSales.quantity_sold).label('quantity_sold')
+    revenue = func.sum(ProductSales.total_revenue).label('total_revenue')
+    filters = []
+    if start:
+        filters.append(ProductSales.recorded_on >= start.date())
+    if end:
+        filters.append(ProductSales.recorded_on < end.date() if end.time() == end.time().min
+                       else ProductSales.recorded_on <= end.date())
+    if product_id:
+        filters.append(ProductSales.product_id == product_id)
+
+    if group == 'product':
+        rows = (db.session.query(ProductSales.product_id, Product.name, qty, revenue)
+                .join(Product, Product.id == ProductSales.product_id)
+                .filter(*filters)
+                .group_by(ProductSales.product_id, Product.name)
+                .order_by(revenue.desc())
+                .limit(limit)
+                .all())
+        items = [{"product_id": r.product_id, "name": r.name, "quantity_sold": int(r.quantity_sold),
+                  "total_revenue": round(r.total_revenue, 2)} for r in rows]
+    else:
+        rows = (db.session.query(ProductSales.recorded_on, qty, revenue)
+                .filter(*filters)
+                .group_by(ProductSales.recorded_on)
+                .order_by(ProductSales.recorded_on.desc())
+                .limit(limit)
+                .all())
+        items = [{"day": r.recorded_on.isoformat(), "quantity_sold": int(r.quantity_sold),
+                  "total_revenue": round(r.total_revenue, 2)} for r in rows]
+
+    totals = db.session.query(qty, revenue).filter(*filters).one()
+    marks = rollup_marks()
+    return jsonify({
+        "group": group,
+        "rows": items,
+        "totals": {"quantity_sold": int(totals.quantity_sold or 0),
+                   "total_revenue": round(totals.total_revenue or 0, 2)},
+        "as_of": marks,
+        # a backfill rebuilds the rollup aside; until it is swapped in these
+        # figures come from the previous rollup, not from the backfill
+        "backfill_running": any(name.endswith(BACKFILL_SUFFIX) for name in marks),
+    }), 200
+# http://127.0.0.1:5000/admin/sales?from=2025-01-01&to=2025-01-31&group=day
+
+
+# Reports over the columnar export (flask reports export); no OLTP queries
+# ?from=&to= filter on order creation time
+@admin_bp.route('/reports/<name>', methods=['GET'])
+@role_required("admin")
+def report(name):
+    if name not in REPORTS:
+        return jsonify({"error": f"Unknown report. Available: {', '.join(sorted(REPORTS))}"}), 404
+    if pa is None:
+        return jsonify({"error": "Reports need pyarrow installed"}), 503
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"report": name, "result": REPORTS[name](start, end), "as_of": export_marks()}), 200
+# http://127.0.0.1:5000/admin/reports/revenue_by_category?from=2025-01-01
+
+
+# Order event outbox: counts by status and this worker's delivery counters
+@admin_bp.route('/events/stats', methods=['GET'])
+@role_required("admin")
+def event_stats():
+    return jsonify(dispatcher.stats()), 200
+
+
+# Requeue dead-lettered events (all of them, or ?id=<event id>)
+@admin_bp.route('/events/retry_dead', methods=['POST'])
+@role_required("admin")
+def retry_dead_events():
+    return jsonify({"requeued": retry_dead(request.args.get('id', type=int))}), 200
+
+
+# Rate limiter: allowed requests and rejections per blueprint and scope
+@admin_bp.route('/rate_limits', methods=['GET'])
+@role_required("admin")
+def rate_limit_stats():
+    return jsonify(limiter.stats()), 200
@@ -1,9 +1,10 @@
 # import app from create_app
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity,create_refresh_token
-from datetime import timedelta
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from app.models import db, User
+from app.passwords import check_password, hash_password, verify_password
+from app.ratelimit import rate_limited
+from app.tokens import claim_refresh, issue_tokens, revoke_session, revoke_token, revoke_user_tokens
 import jwt
 # from config import Config
 
@@ -12,6 +13,7 @@ auth_bp = Blueprint('auth', __name__)
 
 #register
 @auth_bp.route('/register', methods=['POST'])
+@rate_limited
 def register():
     data = request.get_json() or {}
 
@@ -29,7 +31,7 @@ def register():
     if User.query.filter_by(phone=phone).first():
         return jsonify({"error": "Phone number already exists"}), 400
 
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
     new_user = User(name=name, email=email, phone=phone, password=hashed_password, role=role)
     
     db.session.add(new_user)
@@ -46,6 +48,7 @@ def register():
 
 # Register admin
 @auth_bp.route('/register-admin', methods=['POST'])
+@rate_limited
 def register_admin():
     data = request.get_json() or {}
 
@@ -62,7 +65,7 @@ def register_admin():
     if User.query.filter_by(phone=phone).first():
         return jsonify({"error": "Phone number already exists"}), 400
 
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
     new_admin = User(name=name, email=email, phone=phone, password=hashed_password, role="admin")
 
     db.session.add(new_admin)
@@ -92,6 +95,7 @@ def generate_token(user):
 #Login
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited
 def login():
     data = request.get_json() or {}
 
@@ -99,17 +103,22 @@ def login():
     password = data.get('password', "").strip()
 
     user = User.query.filter_by(email=email).first()
+    matches, new_hash = verify_password(user.password, password) if user else (False, None)
 
     # now check user.isActive (camelCase)
-    if not user or not check_password_hash(user.password, password) or not user.isActive:
+    if not matches or not user.isActive:
         return jsonify({"error": "Invalid credentials or account inactive"}), 401
 
-    access_token = create_access_token(identity=str(user.id), expires_delta=timedelta(days=1))
-    refresh_token = create_refresh_token(identity=str(user.id))
+    # stored hash predates the current PASSWORD_HASH_METHOD
+    if new_hash:
+        user.password = new_hash
+        db.session.commit()
 
+    # short-lived access token (role/active claims, see app/authz.py) and a
+    # refresh token for /auth/refresh
     return jsonify({
         "message": "Login successful",
-        "access_token": access_token,
+        **issue_tokens(user),
         "user": {
             "id": user.id,
             "name": user.name,
@@ -134,23 +143,49 @@ def change_password():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     
-    if not user or not check_password_hash(user.password, current_password):
+    if not user or not check_password(user.password, current_password):
         return jsonify({"error": "Current password is incorrect"}), 401
 
     if len(new_password) < 8:
         return jsonify({"error": "New password must be at least 8 characters long"}), 400
 
-    user.password = generate_password_hash(new_password)
+    user.password = hash_password(new_password)
     db.session.commit()
 
-    return jsonify({"message": "Password changed successfully"}), 200
+    # sign out every other session; this client continues with a new pair
+    revoke_user_tokens(user.id)
+    return jsonify({"message": "Password changed successfully", **issue_tokens(user)}), 200
+
+
+
+# Refresh (Authorization: Bearer <refresh_token>)
+# Returns a new access/refresh pair; the refresh token sent is used up.
+# Sending it again means it leaked, so the whole session is revoked.
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    token = get_jwt()
+    if not claim_refresh(token):
+        revoke_session(token.get("sid"))
+        return jsonify({"error": "Refresh token already used, please log in again"}), 401
+
+    user = db.session.get(User, int(get_jwt_identity()))
+    if not user or not user.isActive:
+        revoke_session(token.get("sid"))
+        return jsonify({"error": "Invalid credentials or account inactive"}), 401
+
+    return jsonify(issue_tokens(user, sid=token.get("sid"))), 200
 
 
 
 #Logout
+# Revokes the token sent (access or refresh) and the rest of its session.
 @auth_bp.route('/logout', methods=['POST'])
-@jwt_required()
+@jwt_required(verify_type=False)
 def logout():
+    token = get_jwt()
+    revoke_token(token)
+    revoke_session(token.get("sid"))
     return jsonify({"message": "Logout successful."}), 200
 
 
@@ -0,0 +1,90 @@
+import math
+import time
+from functools import wraps
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from app import app
+from app.cache import TTLCache
+from app.models import db, User
+
+# Authorization from JWT claims.
+#
+# Access tokens carry the user's role and active flag (claims "role" and
+# "active", added at login), so they need no lookup of their own. When an
+# admin bans, re-activates or promotes a user, user_changed() stamps the
+# row (User.authz_changed_at, epoch seconds) in the same commit. Each worker
+# reads that stamp with the current role and active flag, keeping the row
+# for AUTHZ_STAMP_TTL seconds per process; a token issued before the stamp
+# is judged by the row instead of its claims. A change therefore reaches
+# every worker within AUTHZ_STAMP_TTL seconds and survives restarts, and a
+# deleted user reads as inactive.
+
+_rows = TTLCache(maxsize=app.config.get("AUTHZ_CACHE_SIZE", 10000),
+                 ttl=app.config.get("AUTHZ_STAMP_TTL", 5))
+
+
+def user_claims(user):
+    return {"role": user.role, "active": bool(user.isActive)}
+
+
+def user_changed(user):
+    # Call before committing a change to user.role or user.isActive. Rounded
+    # up: a token issued in the same second as the change is re-checked.
+    user.authz_changed_at = math.ceil(time.time())
+    _rows.delete(user.id)
+
+
+def user_removed(user_id):
+    _rows.delete(user_id)
+
+
+def _row(user_id):
+    # -> (authz_changed_at, role, active); (None, None, False) if deleted
+    row = _rows.get(user_id)
+    if row is None:
+        generation = _rows.generation
+        found = db.session.query(User.authz_changed_at, User.role, User.isActive).filter(User.id == user_id).first()
+        row = (found[0] or 0, found[1], bool(found[2])) if found else (None, None, False)
+        _rows.set(user_id, row, generation=generation)
+    return row
+
+
+def _identity():
+    claims = get_jwt()
+    user_id = int(get_jwt_identity())
+    changed_at, role, active = _row(user_id)
+    if "role" in claims and changed_at is not None and claims.get("iat", 0) >= changed_at:
+        return user_id, claims["role"], claims.get("active", True)
+    # changed since the token was issued, deleted, or a token issued before
+    # claims were added
+    return user_id, role, active
+
+
+def role_required(*roles):
+    # jwt_required() plus the caller's active flag, and role if any are given.
+    # The caller is then available as current_user_id() / current_role().
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method == "OPTIONS":
+                return fn(*args, **kwargs)
+            verify_jwt_in_request()
+            user_id, role, active = _identity()
+            if not active:
+                return jsonify({"error": "Account inactive"}), 403
+            if roles and role not in roles:
+                return jsonify({"error": "Unauthorized"}), 403
+            g.authz = (user_id, role)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_user_id():
+    return g.authz[0]
+
+
+def current_role():
+    return g.authz[1]
@@ -0,0 +1,464 @@
+import json
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from app import app
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+# Small thread-safe TTL + LRU cache; this is also the "local" cache backend.
+# Entries expire `ttl` seconds after they were written (ttl=0 never expires)
+# and the least recently used entry is dropped once `maxsize` is reached.
+# `generation` is bumped on every invalidation so a reader that loaded from
+# the database before a write committed cannot put the stale value back
+# (see set(..., generation=...)).
+class TTLCache:
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _lookup(self, key, now):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at < now:
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _store(self, key, value, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else float("inf")
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key, time.monotonic())
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def get_many(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                value = self._lookup(key, now)
+                if value is _MISSING:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def add(self, key, value, ttl=None):
+        # Set only if absent; returns the value now stored.
+        with self._lock:
+            current = self._lookup(key, time.monotonic())
+            if current is not _MISSING:
+                return current
+            self._store(key, value, ttl)
+            return value
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = self._lookup(key, time.monotonic())
+            value = (0 if value is _MISSING else int(value)) + amount
+            self._store(key, value, 0)
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "local",
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+class RedisError(Exception):
+    pass
+
+
+# Minimal RESP (Redis protocol) client: one socket per thread, commands can be
+# pipelined or run as a WATCH/MULTI/EXEC transaction. Only what the cache
+# backend needs is implemented, so it works against Redis, KeyDB, Dragonfly
+# or scripts/fake_redis.py alike.
+class RedisClient:
+
+    def __init__(self, url, timeout=2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        if self.password:
+            self._roundtrip(conn, [("AUTH", self.password)])
+        if self.db:
+            self._roundtrip(conn, [("SELECT", self.db)])
+        return conn
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn:
+            try:
+                conn[0].close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                data = arg
+            else:
+                data = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    @classmethod
+    def read_reply(cls, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            if size < 0:
+                return None
+            return [cls.read_reply(reader) for _ in range(size)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def _roundtrip(self, conn, commands):
+        sock, reader = conn
+        sock.sendall(b"".join(self._encode(c) for c in commands))
+        replies = [self.read_reply(reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def pipeline(self, commands):
+        try:
+            return self._roundtrip(self._conn(), commands)
+        except (OSError, ConnectionError):
+            # One reconnect attempt; a server restart should not fail requests
+            # twice in a row.
+            self._drop()
+            return self._roundtrip(self._conn(), commands)
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def transaction(self, watch_key, check, commands):
+        # Runs commands in MULTI/EXEC if check(GET watch_key) holds and the
+        # key is not written in between (WATCH); -> EXEC replies, or None if
+        # the check failed or the transaction was aborted. Not retried once
+        # the key is watched: a new connection would drop the WATCH.
+        try:
+            conn = self._conn()
+            _, current = self._roundtrip(conn, [("WATCH", watch_key), ("GET", watch_key)])
+        except (OSError, ConnectionError):
+            self._drop()
+            conn = self._conn()
+            _, current = self._roundtrip(conn, [("WATCH", watch_key), ("GET", watch_key)])
+        try:
+            if not check(current):
+                self._roundtrip(conn, [("UNWATCH",)])
+                return None
+            return self._roundtrip(conn, [("MULTI",)] + list(commands) + [("EXEC",)])[-1]
+        except (OSError, ConnectionError):
+            self._drop()
+            raise
+
+    def subscribe(self, channel, callback, stop_event):
+        # Blocking pub/sub loop; reconnects with a short back-off.
+        while not stop_event.is_set():
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                sock.settimeout(None)
+                reader = sock.makefile("rb")
+                if self.password:
+                    sock.sendall(self._encode(("AUTH", self.password)))
+                    self.read_reply(reader)
+                sock.sendall(self._encode(("SUBSCRIBE", channel)))
+                while not stop_event.is_set():
+                    reply = self.read_reply(reader)
+                    if isinstance(reply, list) and reply and reply[0] == b"message":
+                        callback(reply[2])
+            except (OSError, ConnectionError, RedisError) as e:
+                logger.warning("cache invalidation subscriber disconnected: %s", e)
+                stop_event.wait(1.0)
+
+
+# Shared cache backend over the Redis protocol. Values are JSON encoded and
+# keys are namespaced as <prefix>:<name>:<key>. A short-lived local near-cache
+# absorbs hot reads; every delete/clear is published on a channel so the
+# near-caches of all workers evict the entry as well.
+class RedisCache:
+
+    def __init__(self, client, name, prefix, ttl=300, near_ttl=2, near_size=1024):
+        self.client = client
+        self.name = name
+        self.ttl = ttl
+        self._prefix = f"{prefix}:{name}:"
+        self._gen_key = f"{prefix}:{name}::generation"
+        self.channel = f"{prefix}:invalidate"
+        self.near = TTLCache(maxsize=near_size, ttl=near_ttl) if near_ttl else None
+        self.hits = 0
+        self.misses = 0
+
+    def _k(self, key):
+        return self._prefix + key
+
+    @property
+    def generation(self):
+        return int(self.client.execute("GET", self._gen_key) or 0)
+
+    def get(self, key, default=None):
+        if self.near is not None:
+            value = self.near.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+        raw = self.client.execute("GET", self._k(key))
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        value = json.loads(raw)
+        if self.near is not None:
+            self.near.set(key, value)
+        return value
+
+    def get_many(self, keys):
+        found = {}
+        remote = []
+        for key in keys:
+            value = self.near.get(key, _MISSING) if self.near is not None else _MISSING
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if remote:
+            raws = self.client.execute("MGET", *[self._k(k) for k in remote])
+            for key, raw in zip(remote, raws):
+                if raw is not None:
+                    value = found[key] = json.loads(raw)
+                    if self.near is not None:
+                        self.near.set(key, value)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value, ttl=None, generation=None):
+        ttl = self.ttl if ttl is None else ttl
+        payload = json.dumps(value, separators=(",", ":"))
+        command = ("SET", self._k(key), payload) + (("EX", int(ttl)) if ttl else ())
+        if generation is None:
+            self.client.execute(*command)
+        elif self.client.transaction(self._gen_key, lambda current: int(current or 0) == generation,
+                                     [command]) is None:
+            # a delete/clear ran since the caller read the generation
+            return False
+        if self.near is not None:
+            self.near.set(key, value)
+        return True
+
+    def add(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        cmd = ["SET", self._k(key), json.dumps(value), "NX"]
+        if ttl:
+            cmd += ["EX", int(ttl)]
+        self.client.execute(*cmd)
+        return self.get(key)
+
+    def incr(self, key, amount=1):
+        value = self.client.execute("INCRBY", self._k(key), amount)
+        self._broadcast({"keys": [key]})
+        return value
+
+    def delete(self, *keys):
+        commands = [("INCR", self._gen_key)]
+        if keys:
+            commands.append(("DEL",) + tuple(self._k(k) for k in keys))
+        self.client.pipeline(commands)
+        self._broadcast({"keys": list(keys)})
+
+    def clear(self):
+        keys, cursor = [], b"0"
+        while True:
+            cursor, batch = self.client.execute("SCAN", cursor, "MATCH", self._prefix + "*", "COUNT", 1000)
+            keys.extend(k for k in batch if not k.endswith(b"::generation"))
+            if cursor in (b"0", 0, "0"):
+                break
+        commands = [("INCR", self._gen_key)]
+        if keys:
+            commands.append(("DEL",) + tuple(keys))
+        self.client.pipeline(commands)
+        self._broadcast({"clear": True})
+
+    def _broadcast(self, message):
+        if self.near is None:
+            return
+        message["ns"] = self.name
+        self.near.delete(*message.get("keys", []))
+        if message.get("clear"):
+            self.near.clear()
+        self.client.execute("PUBLISH", self.channel, json.dumps(message))
+
+    def on_invalidate(self, message):
+        if self.near is None:
+            return
+        if message.get("clear"):
+            self.near.clear()
+        else:
+            self.near.delete(*message.get("keys", []))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "near_cache": self.near.stats() if self.near is not None else None,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+_redis_client = None
+_subscriber = None
+
+
+def _start_subscriber(client, channel):
+    global _subscriber
+    if _subscriber is not None:
+        return
+
+    def dispatch(raw):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        cache = _caches.get(message.get("ns"))
+        if isinstance(cache, RedisCache):
+            cache.on_invalidate(message)
+
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=client.subscribe, args=(channel, dispatch, stop),
+        name="cache-invalidation", daemon=True,
+    )
+    thread.start()
+    _subscriber = (thread, stop)
+
+
+# Named cache, built from Config on first use:
+#   CACHE_BACKEND = "local" (per process) | "redis" (shared by all workers)
+def get_cache(name, maxsize=1024, ttl=300):
+    global _redis_client
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is not None:
+            return cache
+
+        backend = app.config.get("CACHE_BACKEND", "local")
+        if backend == "local":
+            cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        elif backend == "redis":
+            if _redis_client is None:
+                _redis_client = RedisClient(app.config["CACHE_REDIS_URL"])
+            cache = RedisCache(
+                _redis_client, name,
+                prefix=app.config.get("CACHE_KEY_PREFIX", "grocery"),
+                ttl=ttl,
+                near_ttl=app.config.get("CACHE_NEAR_TTL", 2),
+                near_size=maxsize,
+            )
+            if cache.near is not None:
+                _start_subscriber(_redis_client, cache.channel)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND {backend!r}")
+
+        _caches[name] = cache
+        return cache
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
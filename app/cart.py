@@ -1,14 +1,75 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
+from flask_jwt_extended import get_jwt_identity
+from app import app, db
+from app.authz import role_required
+from app.cache import get_cache
+from app.catalog import cart_version
 from app.models import Cart, Product
+from sqlalchemy.exc import IntegrityError
 
 cart_bp = Blueprint('cart', __name__)
 
+# user:<id> -> {"version": cart version, "cart": snapshot}
+# The cart version (app/catalog.py) is stored with the snapshot so a price,
+# name or image change of any product makes every cached cart stale without
+# tracking who holds it; stock moves leave it alone.
+cart_cache = get_cache(
+    "cart",
+    maxsize=app.config.get("CART_CACHE_SIZE", 10000),
+    ttl=app.config.get("CART_CACHE_TTL", 120),
+)
+
+
+def invalidate_cart(user_id):
+    cart_cache.delete(f"user:{user_id}")
+
+
+def _load_cart(user_id):
+    # One joined query for the lines and the product columns they show.
+    rows = (db.session.query(
+                Cart.id, Cart.product_id, Cart.quantity, Cart.created_at,
+                Product.name, Product.price, Product.image_url)
+            .join(Product, Product.id == Cart.product_id)
+            .filter(Cart.user_id == user_id)
+            .order_by(Cart.id)
+            .all())
+
+    items = [{
+        'cart_id': r.id,
+        'product_id': r.product_id,
+        'product_name': r.name,
+        'quantity': r.quantity,
+        'price': r.price,
+        'total_price': r.quantity * r.price,
+        'added_at': r.created_at.isoformat(),
+        'image_url': r.image_url or ""
+    } for r in rows]
+
+    return {
+        'items': items,
+        'subtotal': round(sum(i['total_price'] for i in items), 2),
+        'item_count': sum(i['quantity'] for i in items),
+    }
+
+
+def get_cart_snapshot(user_id):
+    key = f"user:{user_id}"
+    version = cart_version()
+    if app.config.get("CART_CACHE_ENABLED", True):
+        cached = cart_cache.get(key)
+        if cached is not None and cached['version'] == version:
+            return cached['cart']
+
+    generation = cart_cache.generation
+    snapshot = _load_cart(user_id)
+    if app.config.get("CART_CACHE_ENABLED", True):
+        cart_cache.set(key, {'version': version, 'cart': snapshot}, generation=generation)
+    return snapshot
+
 
 
 @cart_bp.route('/cart/add', methods=['POST'])
-@jwt_required()
+@role_required()
 def add_to_cart():
     data = request.get_json()
     print("Received data:", data)
@@ -38,21 +99,30 @@ def add_to_cart():
     if product.stock < quantity:
         return jsonify({'message': 'Insufficient stock available'}), 400
 
-    # Check if the product already exists in the user's cart.
-    cart_item = Cart.query.filter_by(user_id=user_id, product_id=product_id).first()
-    if cart_item:
-        cart_item.quantity += quantity
+    # Two requests can both find no line and insert one; the loser hits
+    # uq_cart_user_product and retries once, finding the winner's line.
+    for attempt in range(2):
+        # Check if the product already exists in the user's cart.
+        cart_item = Cart.query.filter_by(user_id=user_id, product_id=product_id).first()
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            new_cart_item = Cart(user_id=user_id, product_id=product_id, quantity=quantity)
+            db.session.add(new_cart_item)
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
     else:
-        new_cart_item = Cart(user_id=user_id, product_id=product_id, quantity=quantity)
-        db.session.add(new_cart_item)
-
-    db.session.commit()
+        return jsonify({'message': 'Cart changed concurrently, please retry'}), 409
+    invalidate_cart(user_id)
     return jsonify({'message': 'Item added to cart'}), 201
 
 
 
 @cart_bp.route('/update_cart_quantity', methods=['POST'])
-@jwt_required()
+@role_required()
 def update_cart_quantity():
     user_id = get_jwt_identity()
     data = request.get_json()
@@ -79,13 +149,14 @@ def update_cart_quantity():
         cart_item.quantity = quantity
 
     db.session.commit()
+    invalidate_cart(user_id)
     return jsonify({'message': 'Cart updated successfully'}), 200
 
 
 
 
 @cart_bp.route('/cart/remove/<int:cart_id>', methods=['DELETE'])
-@jwt_required()
+@role_required()
 def remove_from_cart(cart_id):
     user_id = get_jwt_identity()
     cart_item = Cart.query.filter_by(id=cart_id, user_id=user_id).first()
@@ -95,10 +166,11 @@ def remove_from_cart(cart_id):
 
     db.session.delete(cart_item)
     db.session.commit()
+    invalidate_cart(user_id)
     return jsonify({'message': 'Item removed from cart'}), 200
 
 @cart_bp.route('/cart/update', methods=['PUT'])
-@jwt_required()
+@role_required()
 def update_cart():
     data = request.get_json()
     user_id = get_jwt_identity()
@@ -122,42 +194,139 @@ def update_cart():
         message = 'Cart updated successfully'
 
     db.session.commit()
+    invalidate_cart(user_id)
     return jsonify({'message': message}), 200
 
 
 
 
+# View cart
+# Returns the list of lines (old clients); ?summary=1 returns
+#   {"items": [...], "subtotal": ..., "item_count": ...}
 @cart_bp.route('/cart/view', methods=['GET', 'OPTIONS'])
+@role_required()
 def view_cart():
+    # role_required lets OPTIONS through unauthenticated
     if request.method == 'OPTIONS':
-        return jsonify({'message': 'CORS preflight'}), 200 
-
-
-    from flask_jwt_extended import jwt_required, get_jwt_identity
-
-    @jwt_required()
-    def get_cart():
-        user_id = get_jwt_identity()
-        cart_items = Cart.query.filter_by(user_id=user_id).all()
-
-        cart_data = []
-        for item in cart_items:
-            cart_data.append({
-                'cart_id': item.id,
-                'product_id': item.product_id,
-                'product_name': item.product.name,
-                'quantity': item.quantity,
-                'price': item.product.price,
-                'total_price': item.quantity * item.product.price,
-                'added_at': item.created_at.isoformat(),
-                'image_url': item.product.image_url or ""
-
-            })
-
-        return jsonify(cart_data), 200
-
-    return get_cart()
-
-
-
-
+        return jsonify({'message': 'CORS preflight'}), 200
+
+    snapshot = get_cart_snapshot(get_jwt_identity())
+    if request.args.get('summary') in ('1', 'true'):
+        return jsonify(snapshot), 200
+    return jsonify(snapshot['items']), 200
+
+
+MAX_BATCH_OPERATIONS = 200
+
+# Apply many cart changes in one request (offline basket sync).
+# {"operations": [{"op": "add", "product_id": 1, "quantity": 2},
+#                 {"op": "set", "product_id": 2, "quantity": 0},
+#                 {"op": "remove", "product_id": 3}      # or "cart_id"
+#                ],
+#  "atomic": false}
+# Operations are applied in order against the current cart; stock for every
+# product involved is read in one query and all writes share one commit.
+# Each operation gets a result entry; failed ones are skipped, or, with
+# "atomic": true, nothing is written at all.
+@cart_bp.route('/cart/batch', methods=['POST'])
+@role_required()
+def batch_update_cart():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'operations must be a non-empty list'}), 422
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'message': f'At most {MAX_BATCH_OPERATIONS} operations per batch'}), 422
+
+    # A concurrent request can insert a line this batch is adding
+    # (uq_cart_user_product); the batch is then replayed once on fresh lines.
+    for attempt in range(2):
+        try:
+            return _apply_batch(user_id, data, operations)
+        except IntegrityError:
+            db.session.rollback()
+    return jsonify({'message': 'Cart changed concurrently, please retry'}), 409
+
+
+def _apply_batch(user_id, data, operations):
+    lines = {item.product_id: item for item in Cart.query.filter_by(user_id=user_id).all()}
+    by_cart_id = {item.id: pid for pid, item in lines.items()}
+
+    def _int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    wanted_ids = set(lines)
+    for op in operations:
+        if isinstance(op, dict) and _int(op.get('product_id')) is not None:
+            wanted_ids.add(_int(op.get('product_id')))
+    stock = dict(db.session.query(Product.id, Product.stock)
+                 .filter(Product.id.in_(wanted_ids)).all()) if wanted_ids else {}
+
+    # product_id -> desired quantity (0 = no line)
+    desired = {pid: item.quantity for pid, item in lines.items()}
+    results = []
+    for index, op in enumerate(operations):
+        error = None
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind not in ('add', 'set', 'remove'):
+            error = "op must be one of add, set, remove"
+        else:
+            product_id = _int(op.get('product_id'))
+            if kind == 'remove' and product_id is None and op.get('cart_id') is not None:
+                product_id = by_cart_id.get(_int(op.get('cart_id')))
+                if product_id is None:
+                    error = 'Cart item not found'
+            quantity = _int(op.get('quantity', 1 if kind == 'add' else None))
+
+            if error:
+                pass
+            elif product_id is None:
+                error = 'Product ID must be a valid integer'
+            elif kind == 'remove':
+                if not desired.get(product_id):
+                    error = 'Item not found in cart'
+                else:
+                    desired[product_id] = 0
+            elif product_id not in stock:
+                error = 'Product not found'
+            elif quantity is None or (kind == 'add' and quantity < 1):
+                error = 'Quantity must be a valid integer'
+            else:
+                new_qty = desired.get(product_id, 0) + quantity if kind == 'add' else max(quantity, 0)
+                if new_qty > stock[product_id]:
+                    error = 'Insufficient stock available'
+                else:
+                    desired[product_id] = new_qty
+
+        result = {'index': index, 'ok': error is None}
+        if error:
+            result['error'] = error
+        results.append(result)
+
+    failed = [r for r in results if not r['ok']]
+    if failed and data.get('atomic'):
+        return jsonify({'results': results, 'cart': get_cart_snapshot(user_id)}), 422
+
+    new_lines = []
+    for product_id, qty in desired.items():
+        line = lines.get(product_id)
+        if line and qty <= 0:
+            db.session.delete(line)
+        elif line and line.quantity != qty:
+            line.quantity = qty
+        elif not line and qty > 0:
+            new_lines.append(Cart(user_id=user_id, product_id=product_id, quantity=qty))
+    db.session.add_all(new_lines)
+    db.session.commit()
+    invalidate_cart(user_id)
+
+    return jsonify({
+        'results': results,
+        'applied': len(results) - len(failed),
+        'failed': len(failed),
+        'cart': get_cart_snapshot(user_id),
+    }), 200
@@ -0,0 +1,130 @@
+import hashlib
+import time
+
+from app import app
+from app.cache import get_cache
+from app.models import Product
+
+# Catalog versioning, caching and serialization helpers shared by the
+# product API.
+#
+# Every code path that changes a Product row (admin CRUD, stock moves during
+# checkout and returns, inventory resets) calls invalidate_catalog() after
+# its commit. That evicts the cached product dicts / category indexes and
+# bumps the catalog version. Readers derive their ETag from the version, so
+# a conditional GET can be answered with a 304 before any product row is read
+# or serialized. A second counter, the cart version, moves only when what a
+# cart line shows (name, price, image) may have changed, so checkouts and
+# other stock-only moves do not invalidate every cached cart.
+
+PRODUCT_FIELDS = ("id", "name", "description", "category", "price", "unit", "stock", "image_url",
+                  "image_variants")
+
+# product:<id>   -> Product.to_dict()
+# category:<name> -> [product ids] ordered by id
+# all             -> [product ids] ordered by id
+catalog_cache = get_cache(
+    "catalog",
+    maxsize=app.config.get("CATALOG_CACHE_SIZE", 5000),
+    ttl=app.config.get("CATALOG_CACHE_TTL", 300),
+)
+# Catalog version lives in its own namespace so clearing the catalog entries
+# never resets it. With a shared backend all workers see the same version.
+meta_cache = get_cache("meta", maxsize=64, ttl=0)
+
+
+def _version(name):
+    version = meta_cache.get(name)
+    if version is None:
+        # Seed from the clock so a restart (or a flushed shared cache) never
+        # reuses an old ETag.
+        version = meta_cache.add(name, int(time.time() * 1000), ttl=0)
+    return version
+
+
+def catalog_version():
+    return _version("catalog_version")
+
+
+def cart_version():
+    return _version("cart_version")
+
+
+def bump_catalog_version():
+    catalog_version()
+    return meta_cache.incr("catalog_version")
+
+
+def bump_cart_version():
+    cart_version()
+    return meta_cache.incr("cart_version")
+
+
+def invalidate_catalog(product_ids=None, carts=True):
+    # Call after the commit that changed the products. Without ids every
+    # entry is dropped (deletes, category changes, bulk resets). carts=False
+    # when no name, price or image changed (stock moves), which leaves the
+    # cached carts valid.
+    if product_ids is None:
+        catalog_cache.clear()
+    else:
+        # Stock moves never change category membership and the list entries
+        # hold nothing but ids, so only the product entries need to go.
+        catalog_cache.delete(*[f"product:{pid}" for pid in product_ids])
+    bump_catalog_version()
+    if carts:
+        bump_cart_version()
+
+
+def catalog_etag(*parts):
+    key = "|".join(str(p) for p in (catalog_version(),) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def get_product_dicts(ids):
+    # Cached dicts for `ids` (in order); misses are loaded with one IN query.
+    found = catalog_cache.get_many([f"product:{pid}" for pid in ids])
+    missing = [pid for pid in ids if f"product:{pid}" not in found]
+    if missing:
+        generation = catalog_cache.generation
+        for product in Product.query.filter(Product.id.in_(missing)).all():
+            data = product.to_dict()
+            catalog_cache.set(f"product:{product.id}", data, generation=generation)
+            found[f"product:{product.id}"] = data
+    return [found[f"product:{pid}"] for pid in ids if f"product:{pid}" in found]
+
+
+def get_product_dict(product_id):
+    dicts = get_product_dicts([product_id])
+    return dicts[0] if dicts else None
+
+
+def get_catalog_ids(category=None):
+    key = f"category:{category}" if category else "all"
+    ids = catalog_cache.get(key)
+    if ids is None:
+        generation = catalog_cache.generation
+        query = Product.query.with_entities(Product.id)
+        if category:
+            query = query.filter(Product.category == category)
+        ids = [row.id for row in query.order_by(Product.id)]
+        catalog_cache.set(key, ids, generation=generation)
+    return ids
+
+
+def parse_fields(raw):
+    # ?fields=name,price -> ("id", "name", "price"); id is always kept because
+    # it is the pagination key.
+    if not raw:
+        return PRODUCT_FIELDS
+    wanted = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return tuple(f for f in PRODUCT_FIELDS if f == "id" or f in wanted)
+
+
+def project(data, fields):
+    if len(fields) == len(PRODUCT_FIELDS):
+        return data
+    return {f: data[f] for f in fields}
@@ -0,0 +1,287 @@
+import glob
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from app import app
+from app.models import db, Order, OrderItems, OrderStatusHistory, Payments, Product, RollupState
+from app.sales import rollup_mark
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # reports are optional; the OLTP app runs without them
+    pa = pc = None
+
+logger = logging.getLogger(__name__)
+
+# Columnar export of the order tables for admin reports.
+#
+# `flask reports export` appends every row past a table's high-water mark
+# (RollupState "export.<table>") to a new Arrow IPC segment file under
+# ANALYTICS_EXPORT_DIR/<table>/, named after its first id. Segments are
+# immutable, so a report memory-maps them and runs vectorized Arrow
+# compute over the columns; it never queries the database. The product
+# dimension (name, category) is small and rewritten whole on every run.
+#
+# Orders are exported once with the status they were created with; the
+# current status is derived from the exported status history.
+
+EXPORT_LAG_SECONDS = 60
+
+
+def _exports():
+    return {
+        "orders": {
+            "model": Order,
+            "columns": [("id", pa.int64()), ("user_id", pa.int64()), ("total_price", pa.float64()),
+                        ("status", pa.string()), ("created_at", pa.timestamp("us"))],
+            "stamp": Order.created_at,
+        },
+        "order_items": {
+            "model": OrderItems,
+            "columns": [("id", pa.int64()), ("order_id", pa.int64()), ("product_id", pa.int64()),
+                        ("quantity", pa.int64()), ("price_at_order_time", pa.float64())],
+            "stamp": Order.created_at,
+            "join": (Order, Order.id == OrderItems.order_id),
+        },
+        "status_history": {
+            "model": OrderStatusHistory,
+            "columns": [("id", pa.int64()), ("order_id", pa.int64()), ("old_status", pa.string()),
+                        ("new_status", pa.string()), ("changed_at", pa.timestamp("us"))],
+            "stamp": OrderStatusHistory.changed_at,
+        },
+        "payments": {
+            "model": Payments,
+            "columns": [("id", pa.int64()), ("order_id", pa.int64()), ("payment_method", pa.string()),
+                        ("status", pa.string()), ("paid_at", pa.timestamp("us"))],
+            "stamp": None,
+        },
+    }
+
+
+PRODUCT_COLUMNS = [("id", "int64"), ("name", "string"), ("category", "string"), ("price", "float64")]
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+
+
+def export_dir(name=None):
+    root = app.config.get("ANALYTICS_EXPORT_DIR")
+    return os.path.join(root, name) if name else root
+
+
+def _write_ipc(table, path):
+    # Write next to the target and rename, so readers never map a
+    # half-written file.
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def export_table(name, chunk_size, cutoff):
+    spec = _exports()[name]
+    model = spec["model"]
+    schema = pa.schema(spec["columns"])
+    os.makedirs(export_dir(name), exist_ok=True)
+    written = 0
+    while True:
+        state = rollup_mark(f"export.{name}")
+        cols = [getattr(model, col) for col, _ in spec["columns"]]
+        stmt = select(*cols, *([spec["stamp"]] if spec["stamp"] is not None else []))
+        if "join" in spec:
+            stmt = stmt.join(*spec["join"])
+        rows = db.session.execute(
+            stmt.where(model.id > state.last_id).order_by(model.id).limit(chunk_size)).all()
+        if spec["stamp"] is not None:
+            fresh = next((i for i, r in enumerate(rows) if r[-1] is not None and r[-1] > cutoff), None)
+            if fresh is not None:
+                rows = rows[:fresh]
+        if not rows:
+            db.session.commit()
+            return written
+
+        width = len(spec["columns"])
+        columns = list(zip(*[r[:width] for r in rows]))
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema)
+        # A crash between the rename and the commit rewrites the same file
+        # (same first id) on the next run, so segments are never doubled.
+        _write_ipc(table, os.path.join(export_dir(name), f"{rows[0][0]:012d}.arrow"))
+        state.last_id = rows[-1][0]
+        state.updated_at = datetime.utcnow()
+        db.session.commit()
+        written += len(rows)
+        if len(rows) < chunk_size:
+            return written
+
+
+def export_products():
+    rows = db.session.execute(select(Product.id, Product.name, Product.category, Product.price)).all()
+    schema = pa.schema(PRODUCT_COLUMNS)
+    columns = list(zip(*rows)) if rows else [[] for _ in PRODUCT_COLUMNS]
+    table = pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema)
+    os.makedirs(export_dir("products"), exist_ok=True)
+    _write_ipc(table, os.path.join(export_dir("products"), "snapshot.arrow"))
+    return len(rows)
+
+
+def run_export(chunk_size=None):
+    require_pyarrow()
+    chunk_size = chunk_size or app.config.get("ANALYTICS_EXPORT_CHUNK_SIZE", 100000)
+    cutoff = datetime.utcnow() - timedelta(seconds=EXPORT_LAG_SECONDS)
+    began = time.perf_counter()
+    stats = {name: export_table(name, chunk_size, cutoff) for name in _exports()}
+    stats["products"] = export_products()
+    stats["elapsed_ms"] = round((time.perf_counter() - began) * 1000, 1)
+    return stats
+
+
+def export_marks():
+    states = RollupState.query.filter(RollupState.name.like("export.%")).all()
+    return {s.name[len("export."):]: {"last_id": s.last_id,
+                                      "updated_at": s.updated_at.isoformat() if s.updated_at else None}
+            for s in states}
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_table(name):
+    # Concatenation of a table's memory-mapped segments. Kept per process
+    # until a segment is added or replaced.
+    require_pyarrow()
+    files = sorted(glob.glob(os.path.join(export_dir(name), "*.arrow")))
+    signature = tuple((f, os.stat(f).st_mtime_ns) for f in files)
+    with _loaded_lock:
+        cached = _loaded.get(name)
+        if cached and cached[0] == signature:
+            return cached[1]
+    if name == "products":
+        schema = pa.schema(PRODUCT_COLUMNS)
+    else:
+        schema = pa.schema(_exports()[name]["columns"])
+    parts = [pa.ipc.open_file(pa.memory_map(f, "r")).read_all() for f in files]
+    table = pa.concat_tables(parts) if parts else schema.empty_table()
+    with _loaded_lock:
+        _loaded[name] = (signature, table)
+    return table
+
+
+# ---- reports: vectorized over the exported columns ----
+
+def _orders(start=None, end=None):
+    orders = load_table("orders")
+    if start:
+        orders = orders.filter(pc.greater_equal(orders["created_at"], pa.scalar(start, pa.timestamp("us"))))
+    if end:
+        orders = orders.filter(pc.less(orders["created_at"], pa.scalar(end, pa.timestamp("us"))))
+    return orders
+
+
+def _items_for(orders):
+    items = load_table("order_items")
+    return items.filter(pc.is_in(items["order_id"], value_set=orders["id"]))
+
+
+def current_status(orders):
+    # Latest new_status per order from the history, falling back to the
+    # status the order was exported with.
+    history = load_table("status_history").select(["id", "order_id", "new_status"])
+    latest = history.group_by("order_id").aggregate([("id", "max")])
+    latest = latest.join(history.select(["id", "new_status"]), keys="id_max", right_keys="id")
+    joined = orders.select(["id", "status", "created_at"]).join(
+        latest.select(["order_id", "new_status"]), keys="id", right_keys="order_id", join_type="left outer")
+    status = pc.coalesce(joined["new_status"], joined["status"])
+    return joined.select(["id", "created_at"]).append_column("current_status", status)
+
+
+def revenue_by_category(start=None, end=None):
+    items = _items_for(_orders(start, end))
+    items = items.append_column(
+        "revenue", pc.multiply(pc.cast(items["quantity"], pa.float64()), items["price_at_order_time"]))
+    products = load_table("products").select(["id", "category"])
+    joined = items.join(products, keys="product_id", right_keys="id", join_type="left outer")
+    joined = joined.set_column(
+        joined.schema.get_field_index("category"), "category",
+        pc.fill_null(joined["category"], "Unknown"))
+    grouped = joined.group_by("category").aggregate([
+        ("revenue", "sum"), ("quantity", "sum"), ("order_id", "count_distinct")])
+    grouped = grouped.sort_by([("revenue_sum", "descending")])
+    return [{"category": r["category"], "revenue": round(r["revenue_sum"], 2),
+             "units": r["quantity_sum"], "orders": r["order_id_count_distinct"]}
+            for r in grouped.to_pylist()]
+
+
+def cancellation_rate(start=None, end=None):
+    statuses = current_status(_orders(start, end))
+    cancelled = pc.cast(pc.equal(statuses["current_status"], "Cancelled"), pa.int64())
+    table = pa.table({
+        "month": pc.strftime(statuses["created_at"], format="%Y-%m"),
+        "cancelled": cancelled,
+    })
+    grouped = table.group_by("month").aggregate([("cancelled", "sum"), ("cancelled", "count")])
+    grouped = grouped.sort_by([("month", "ascending")])
+    months = [{"month": r["month"], "orders": r["cancelled_count"], "cancelled": r["cancelled_sum"],
+               "rate": round(r["cancelled_sum"] / r["cancelled_count"], 4) if r["cancelled_count"] else 0.0}
+              for r in grouped.to_pylist()]
+    total = len(statuses)
+    total_cancelled = pc.sum(cancelled).as_py() or 0
+    return {"orders": total, "cancelled": total_cancelled,
+            "rate": round(total_cancelled / total, 4) if total else 0.0, "by_month": months}
+
+
+def average_cart_size(start=None, end=None):
+    orders = _orders(start, end)
+    per_order = _items_for(orders).group_by("order_id").aggregate([
+        ("quantity", "sum"), ("product_id", "count_distinct")])
+    count = len(per_order)
+    return {
+        "orders": len(orders),
+        "avg_units": round(pc.mean(per_order["quantity_sum"]).as_py(), 2) if count else 0.0,
+        "avg_distinct_products": round(pc.mean(per_order["product_id_count_distinct"]).as_py(), 2) if count else 0.0,
+        "avg_order_value": round(pc.mean(orders["total_price"]).as_py(), 2) if len(orders) else 0.0,
+    }
+
+
+REPORTS = {
+    "revenue_by_category": revenue_by_category,
+    "cancellation_rate": cancellation_rate,
+    "average_cart_size": average_cart_size,
+}
+
+
+reports_cli = AppGroup("reports", help="Columnar export for admin reports")
+
+
+@reports_cli.command("export")
+@click.option("--chunk-size", type=int, default=None, help="Rows per segment file.")
+@click.option("--interval", type=float, default=0, help="Repeat every N seconds (0 = run once).")
+def export_command(chunk_size, interval):
+    while True:
+        try:
+            stats = run_export(chunk_size=chunk_size)
+            click.echo(f"{datetime.utcnow().isoformat()} " +
+                       " ".join(f"{k}={v}" for k, v in stats.items()))
+        except Exception:
+            db.session.rollback()
+            logger.exception("columnar export failed")
+            if not interval:
+                raise
+        finally:
+            db.session.remove()
+        if not interval:
+            break
+        time.sleep(interval)
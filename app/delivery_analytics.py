@@ -0,0 +1,116 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, func, select
+
+from app.models import db, DeliveryAnalytics, Order, RunnerAssignments
+
+# DeliveryAnalytics rows are written by runner status transitions
+# (delivery_boy.update_assignment) and read by the percentile report below.
+
+PERCENTILES = (50, 90, 99)
+
+
+def record_delivery_transition(assignment, new_status, at):
+    # Called inside the transaction that moves the assignment.
+    order = assignment.order
+    row = DeliveryAnalytics.query.filter_by(order_id=order.id).first()
+    if row is None:
+        row = DeliveryAnalytics(order_id=order.id, user_id=order.user_id,
+                                order_placed_at=order.created_at)
+        db.session.add(row)
+    row.runner_id = assignment.runner_id
+    if new_status == 'picked_up':
+        row.order_picked_at = at
+    elif new_status == 'delivered':
+        row.order_picked_at = row.order_picked_at or assignment.picked_up_at
+        row.order_delivered_at = at
+        row.delivery_minutes = round((at - order.created_at).total_seconds() / 60, 2)
+        row.delivered_on = at.date()
+    return row
+
+
+def delivery_percentiles(group, start=None, end=None, runner_id=None, limit=100):
+    # Nearest-rank p50/p90/p99 of delivery_minutes per group, computed in
+    # the database: ROW_NUMBER() ranks each delivery inside its group and
+    # the k-th percentile is the smallest value whose rank reaches k% of
+    # the group size. Only aggregates come back to Python.
+    keys = {
+        'runner': [DeliveryAnalytics.runner_id],
+        'day': [DeliveryAnalytics.delivered_on],
+        'runner_day': [DeliveryAnalytics.runner_id, DeliveryAnalytics.delivered_on],
+    }[group]
+
+    filters = [DeliveryAnalytics.delivery_minutes.isnot(None)]
+    if start:
+        filters.append(DeliveryAnalytics.delivered_on >= start)
+    if end:
+        filters.append(DeliveryAnalytics.delivered_on < end)
+    if runner_id:
+        filters.append(DeliveryAnalytics.runner_id == runner_id)
+
+    ranked = (select(*keys, DeliveryAnalytics.delivery_minutes.label('minutes'),
+                     func.row_number().over(partition_by=keys,
+                                            order_by=DeliveryAnalytics.delivery_minutes).label('rn'),
+                     func.count().over(partition_by=keys).label('n'))
+              .where(*filters)
+              .subquery())
+    group_cols = [ranked.c[k.key] for k in keys]
+    pct_cols = [
+        func.min(case((ranked.c.rn * 100 >= p * ranked.c.n, ranked.c.minutes))).label(f'p{p}')
+        for p in PERCENTILES
+    ]
+    stmt = (select(*group_cols, func.count().label('deliveries'),
+                   func.avg(ranked.c.minutes).label('mean'), *pct_cols)
+            .group_by(*group_cols)
+            .order_by(*[c.desc() if c.key == 'delivered_on' else c for c in group_cols])
+            .limit(limit))
+
+    rows = []
+    for r in db.session.execute(stmt):
+        m = r._mapping
+        row = {k.key: (m[k.key].isoformat() if k.key == 'delivered_on' else m[k.key]) for k in keys}
+        row['deliveries'] = m['deliveries']
+        row['mean_minutes'] = round(m['mean'], 2)
+        for p in PERCENTILES:
+            row[f'p{p}_minutes'] = m[f'p{p}']
+        rows.append(row)
+    return rows
+
+
+def backfill_delivery_analytics(batch_size=1000):
+    # Creates rows for deliveries completed before the transitions wrote
+    # them, in batches of delivered assignments; returns the count.
+    written = 0
+    last_id = 0
+    while True:
+        batch = (db.session.query(RunnerAssignments, Order)
+                 .join(Order, Order.id == RunnerAssignments.order_id)
+                 .filter(RunnerAssignments.id > last_id,
+                         RunnerAssignments.status == 'delivered',
+                         RunnerAssignments.delivered_at.isnot(None))
+                 .order_by(RunnerAssignments.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            return written
+        last_id = batch[-1][0].id
+        have = {row.order_id for row in DeliveryAnalytics.query
+                .with_entities(DeliveryAnalytics.order_id)
+                .filter(DeliveryAnalytics.order_id.in_([o.id for _, o in batch]),
+                        DeliveryAnalytics.delivery_minutes.isnot(None))}
+        for ra, order in batch:
+            if order.id in have:
+                continue
+            record_delivery_transition(ra, 'delivered', ra.delivered_at)
+            have.add(order.id)
+            written += 1
+        db.session.commit()
+
+
+analytics_cli = AppGroup("analytics", help="Delivery analytics maintenance")
+
+
+@analytics_cli.command("backfill-deliveries")
+@click.option("--batch-size", type=int, default=1000)
+def backfill_deliveries_command(batch_size):
+    click.echo(f"backfilled {backfill_delivery_analytics(batch_size)} deliveries")
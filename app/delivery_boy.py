@@ -1,42 +1,50 @@
 # runner.py
 
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from app import app
+from app.authz import current_role, current_user_id, role_required, user_changed
+from app.cache import get_cache
+from app.delivery_analytics import delivery_percentiles, record_delivery_transition
+from app.dispatch import ACTIVE_ASSIGNMENT_STATUSES, DISPATCHABLE_STATUSES, run_dispatch
+from app.events import publish, subscribe
+from app.geo import order_location, runner_index, timed_nearest
+from app.order_summary import set_summary_status
+from app.passwords import hash_password
+from app.pagination import decode_cursor, encode_cursor, parse_date_range, parse_limit, wants_page
+from sqlalchemy import and_, func, or_
 from app.models import db, User, Order, RunnerAssignments
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 
 
 runner_bp = Blueprint('runner', __name__,)
 
-def is_admin(user_id):
-    u = User.query.get(user_id)
-    return u and u.role == 'admin'
+# list:<status> -> serialized runner list; dropped on every runner/assignment change
+runner_cache = get_cache("runners", maxsize=64, ttl=app.config.get("RUNNER_LIST_CACHE_TTL", 10))
+
+def invalidate_runner_list():
+    runner_cache.clear()
+
+OPEN_ASSIGNMENT_STATUSES = ['assigned', 'picked_up']
 
 # 1️⃣ Promote an existing user to Runner (or create a fresh Runner)
 @runner_bp.route('/promote/<int:user_id>', methods=['PUT'])
-@jwt_required()
+@role_required("admin")
 def promote_to_runner(user_id):
-    admin_id = get_jwt_identity()
-    if not is_admin(admin_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
 
     user.role = 'runner'
+    user_changed(user)
     db.session.commit()
+    invalidate_runner_list()
     return jsonify({"message": f"User {user.name} is now a Runner."}), 200
 
 # 2️⃣ Update Runner info (name, email, phone)
 @runner_bp.route('/<int:runner_id>', methods=['PUT'])
-@jwt_required()
+@role_required("admin")
 def update_runner_info(runner_id):
-    admin_id = get_jwt_identity()
-    if not is_admin(admin_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     runner = User.query.filter_by(id=runner_id, role='runner').first()
     if not runner:
         return jsonify({"error": "Runner not found"}), 404
@@ -46,16 +54,13 @@ def update_runner_info(runner_id):
         if fld in data:
             setattr(runner, fld, data[fld].strip())
     db.session.commit()
+    invalidate_runner_list()
     return jsonify({"message": "Runner info updated"}), 200
 
 # 3️⃣ Toggle Runner active/inactive (ban/unban)
 @runner_bp.route('/<int:runner_id>/active', methods=['PUT'])
-@jwt_required()
+@role_required("admin")
 def set_runner_active(runner_id):
-    admin_id = get_jwt_identity()
-    if not is_admin(admin_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     runner = User.query.filter_by(id=runner_id, role='runner').first()
     if not runner:
         return jsonify({"error": "Runner not found"}), 404
@@ -65,19 +70,20 @@ def set_runner_active(runner_id):
         return jsonify({"error": "isActive required"}), 400
 
     runner.isActive = bool(data['isActive'])
+    user_changed(runner)
     db.session.commit()
+    invalidate_runner_list()
     status = "activated" if runner.isActive else "banned"
     return jsonify({"message": f"Runner {status}."}), 200
 
 # 4️⃣ Assign a Runner to an Order
 @runner_bp.route('/assign', methods=['POST'])
-@jwt_required()
+@role_required("admin")
 def assign_runner():
-    admin_id = get_jwt_identity()
-    if not is_admin(admin_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     data = request.get_json() or {}
+    if data.get('auto'):
+        return _auto_assign(data)
+
     order_id = data.get('order_id')
     runner_id = data.get('runner_id')
     if not order_id or not runner_id:
@@ -94,7 +100,7 @@ def assign_runner():
     # Check runner free (no open assignment)
     open_assign = RunnerAssignments.query.filter_by(
         runner_id=runner_id
-    ).filter(RunnerAssignments.status.in_(['assigned','picked_up'])).first()
+    ).filter(RunnerAssignments.status.in_(OPEN_ASSIGNMENT_STATUSES)).first()
     if open_assign:
         return jsonify({"error": "Runner is currently engaged"}), 400
 
@@ -102,19 +108,114 @@ def assign_runner():
     ra = RunnerAssignments(order_id=order_id, runner_id=runner_id)
     db.session.add(ra)
     db.session.commit()
+    invalidate_runner_list()
     return jsonify({"message": f"Runner {runner.name} assigned to order {order.id}"}), 201
 
 
+# 4️⃣b Auto-assign: {"order_id": 1, "auto": true, "k": 5, "max_km": 10, "dry_run": false}
+# Looks up the k nearest free, active runners to the order's delivery address
+# in the in-memory location index, confirms them with one query and assigns
+# the closest one (unless dry_run). "latitude"/"longitude" in the body
+# override the address coordinates.
+def _auto_assign(data):
+    order = Order.query.get(data.get('order_id')) if data.get('order_id') else None
+    if not order:
+        return jsonify({"error": "Order not found"}), 404
+    # same rules as batch dispatch: only orders awaiting delivery, once
+    if order.status not in DISPATCHABLE_STATUSES:
+        return jsonify({"error": f"Order is {order.status}, not awaiting a runner"}), 400
+    if RunnerAssignments.query.filter(
+            RunnerAssignments.order_id == order.id,
+            RunnerAssignments.status.in_(ACTIVE_ASSIGNMENT_STATUSES)).first():
+        return jsonify({"error": "Order already has a runner"}), 409
+
+    try:
+        k = max(1, min(int(data.get('k', 5)), 50))
+        max_km = float(data['max_km']) if data.get('max_km') is not None else None
+        if data.get('latitude') is not None:
+            point = (float(data['latitude']), float(data['longitude']))
+        else:
+            point = order_location(order)
+    except (TypeError, ValueError, KeyError):
+        return jsonify({"error": "k, max_km, latitude and longitude must be numbers"}), 400
+    if point is None:
+        return jsonify({"error": "Order has no delivery coordinates"}), 400
+
+    index = runner_index()
+    candidates, lookup_ms, free = [], 0.0, {}
+    # The index does not know who is engaged; over-fetch and confirm in SQL,
+    # widening the search if too many of the nearest runners are busy.
+    for oversample in (4, 16, 64):
+        hits, took = timed_nearest(index, point[0], point[1], k * oversample, max_km=max_km)
+        lookup_ms += took
+        if not hits:
+            break
+        query, open_assign = runner_engagement_query()
+        free = {r.id: r for r in query.filter(
+            User.id.in_([rid for _, rid in hits]),
+            open_assign.c.assignment_id.is_(None))}
+        candidates = [(d, rid) for d, rid in hits if rid in free][:k]
+        if len(candidates) >= k or len(hits) < k * oversample:
+            break
+
+    result = {
+        "order_id": order.id,
+        "lookup_ms": round(lookup_ms, 3),
+        "candidates": [{"runner_id": rid, "name": free[rid].name, "distance_km": round(d, 3)}
+                       for d, rid in candidates],
+    }
+    if not candidates:
+        return jsonify(dict(result, error="No free runner nearby")), 404
+    if data.get('dry_run'):
+        return jsonify(result), 200
+
+    runner_id = candidates[0][1]
+    db.session.add(RunnerAssignments(order_id=order.id, runner_id=runner_id))
+    db.session.commit()
+    invalidate_runner_list()
+    return jsonify(dict(result, runner_id=runner_id,
+                        message=f"Runner {free[runner_id].name} assigned to order {order.id}")), 201
+
+
+# 🚚 Batch dispatch: match all unassigned orders to free runners at once
+# ?dry_run=1 returns the plan without writing it.
+@runner_bp.route('/dispatch', methods=['POST'])
+@role_required("admin")
+def dispatch_orders():
+    dry_run = request.args.get('dry_run') in ('1', 'true')
+    plan = run_dispatch(dry_run=dry_run)
+    if not dry_run and plan["assignments"]:
+        invalidate_runner_list()
+    return jsonify(plan), 200
+
+
+# 📍 Runner location ping {"latitude": .., "longitude": ..}
+# Only updates the in-memory index; positions are written to runner_location
+# in batches by the background sync (see app/geo.py).
+@runner_bp.route('/location', methods=['POST'])
+@role_required("runner")
+def report_location():
+
+    data = request.get_json() or {}
+    try:
+        lat, lon = float(data['latitude']), float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "latitude and longitude required"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "latitude/longitude out of range"}), 400
+
+    runner_index().update(current_user_id(), lat, lon)
+    return jsonify({"message": "Location recorded"}), 202
+
+
 # 🔄 5. Update Runner Assignment Status
 @runner_bp.route('/assignment/<int:assign_id>', methods=['PUT'])
-@jwt_required()
+@role_required()
 def update_assignment(assign_id):
-    user_id = get_jwt_identity()
-    user    = User.query.get(user_id)
     ra      = RunnerAssignments.query.get(assign_id)
     if not ra:
         return jsonify({"error": "Assignment not found"}), 404
-    if user.role != 'admin' and ra.runner_id != user_id:
+    if current_role() != 'admin' and ra.runner_id != current_user_id():
         return jsonify({"error": "Unauthorized"}), 403
 
     data = request.get_json() or {}
@@ -123,12 +224,13 @@ def update_assignment(assign_id):
         return jsonify({"error": "Invalid status"}), 400
 
     # Explicit updates
+    now = datetime.utcnow()
     if new_status == 'picked_up':
-        ra.picked_up_at    = datetime.utcnow()
+        ra.picked_up_at    = now
         ra.status         = 'picked_up'
         ra.order.status   = 'Out_for_delivery'
     elif new_status == 'delivered':
-        ra.delivered_at   = datetime.utcnow()
+        ra.delivered_at   = now
         ra.status         = 'delivered'
         ra.order.status   = 'Delivered'
     elif new_status == 'cancelled':
@@ -136,45 +238,89 @@ def update_assignment(assign_id):
         ra.order.status   = 'Cancelled'
     else:
         ra.status = 'assigned'
+    if new_status != 'assigned':
+        set_summary_status(ra.order_id, ra.order.status)
+    publish("delivery.status_changed", assignment_id=ra.id, order_id=ra.order_id,
+            runner_id=ra.runner_id, status=new_status, at=now.isoformat())
 
     db.session.commit()
+    invalidate_runner_list()
     return jsonify({"message": f"Assignment and order marked '{new_status}'"}), 200
 
 
 
 
 # 6️⃣ List Runners by Engagement
+def runner_engagement_query():
+    # Active runners outer-joined to their open assignment (if any) in one
+    # grouped query instead of one RunnerAssignments lookup per runner.
+    open_assign = (db.session.query(
+            RunnerAssignments.runner_id.label('runner_id'),
+            func.min(RunnerAssignments.id).label('assignment_id'),
+            func.min(RunnerAssignments.assigned_at).label('engaged_since'))
+        .filter(RunnerAssignments.status.in_(OPEN_ASSIGNMENT_STATUSES))
+        .group_by(RunnerAssignments.runner_id)
+        .subquery())
+    query = (db.session.query(
+            User.id, User.name, User.email, User.phone,
+            open_assign.c.assignment_id, open_assign.c.engaged_since)
+        .outerjoin(open_assign, open_assign.c.runner_id == User.id)
+        .filter(User.role == 'runner', User.isActive == True))
+    return query, open_assign
+
+# optional filter ?status=free|engaged, optional paging ?limit=&cursor=
+# (keyset on runner id; the response becomes {"runners": [...], "next_cursor"})
 @runner_bp.route('/get_runner_list', methods=['GET'])
-@jwt_required()
+@role_required()
 def list_runners():
-    # optional filter ?status=free|engaged
     status = request.args.get('status')
-    base = User.query.filter_by(role='runner', isActive=True)
-    runners = []
-    for r in base:
-        open_assign = RunnerAssignments.query.filter_by(
-            runner_id=r.id
-        ).filter(RunnerAssignments.status.in_(['assigned','picked_up'])).first()
-        engaged = bool(open_assign)
-        if status=='free' and engaged:   continue
-        if status=='engaged' and not engaged:   continue
-        runners.append({
+    paged = wants_page(request.args)
+    try:
+        limit = parse_limit(request.args.get('limit')) if paged else None
+        cursor = decode_cursor(request.args.get('cursor'))
+        after_id = int(cursor['id']) if cursor else 0
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({"error": str(e) or "Invalid cursor"}), 400
+
+    cache_key = f"list:{status or 'all'}:{limit}:{after_id}"
+    page = runner_cache.get(cache_key)
+    if page is None:
+        query, open_assign = runner_engagement_query()
+        if status == 'free':
+            query = query.filter(open_assign.c.assignment_id.is_(None))
+        elif status == 'engaged':
+            query = query.filter(open_assign.c.assignment_id.isnot(None))
+        query = query.filter(User.id > after_id).order_by(User.id)
+        if limit:
+            query = query.limit(limit + 1)
+        rows = query.all()
+
+        page = {"runners": [{
             "id": r.id,
             "name": r.name,
             "email": r.email,
             "phone": r.phone,
-            "engaged": engaged
-        })
+            "engaged": r.assignment_id is not None,
+            "open_assignment_id": r.assignment_id,
+            "engaged_since": r.engaged_since.isoformat() if r.engaged_since else None,
+        } for r in rows[:limit]], "next_cursor": None}
+        if limit and len(rows) > limit:
+            page["next_cursor"] = encode_cursor({"id": rows[limit - 1].id})
+        runner_cache.set(cache_key, page)
+
+    # engaged_seconds depends on "now", so it is added after the cache
+    now = datetime.utcnow()
+    runners = [dict(r, engaged_seconds=int((now - datetime.fromisoformat(r["engaged_since"])).total_seconds())
+                    if r["engaged_since"] else None)
+               for r in page["runners"]]
+    if paged:
+        return jsonify({"runners": runners, "next_cursor": page["next_cursor"]}), 200
     return jsonify(runners), 200
 
 # 7️⃣ Get all Runners with full details
 @runner_bp.route('/all_runners', methods=['GET'])
-@jwt_required()
+@role_required("admin")
 def get_all_runners():
-    admin_id = get_jwt_identity()
-    if not is_admin(admin_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     runners = User.query.filter_by(role='runner').all()
     result = [ 
         {
@@ -189,48 +335,114 @@ def get_all_runners():
 
 
 # 🕓 8. Runner Assignment History
+# One join of assignments with their orders, newest first.
+#   ?from=&to=          filter on assigned_at
+#   ?limit=&cursor=     keyset pages -> {"history": [...], "next_cursor"}
+#   ?format=ndjson      stream every matching row, one JSON object per line
 @runner_bp.route('/<int:runner_id>/history', methods=['GET'])
-@jwt_required()
+@role_required()
 def get_runner_history(runner_id):
- 
-    current_user_id = get_jwt_identity()
-    current = User.query.get(current_user_id)
     # only the runner themself or an admin can view
-    if not (current.role == 'admin' or current.id == runner_id):
+    if not (current_role() == 'admin' or current_user_id() == runner_id):
         return jsonify({"error": "Unauthorized"}), 403
 
-    assignments = RunnerAssignments\
-        .query\
-        .filter_by(runner_id=runner_id)\
-        .order_by(RunnerAssignments.assigned_at.desc())\
-        .all()
-
-    history = []
-    for a in assignments:
-        order = Order.query.get(a.order_id)
-        history.append({
-            "assignment_id":     a.id,
-            "order_id":          a.order_id,
-            "order_status":      order.status,
-            "order_created_at":  order.created_at.isoformat(),
-            "total_price":       order.total_price,
-            "assigned_at":       a.assigned_at.isoformat(),
-            "picked_up_at":      a.picked_up_at.isoformat() if a.picked_up_at else None,
-            "delivered_at":      a.delivered_at.isoformat() if a.delivered_at else None,
-            "assignment_status": a.status
-        })
-
-    return jsonify(history), 200
+    try:
+        start, end = parse_date_range(request.args)
+        cursor = decode_cursor(request.args.get('cursor'))
+        limit = parse_limit(request.args.get('limit')) if wants_page(request.args) else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = (db.session.query(
+            RunnerAssignments.id, RunnerAssignments.order_id, RunnerAssignments.status,
+            RunnerAssignments.assigned_at, RunnerAssignments.picked_up_at,
+            RunnerAssignments.delivered_at,
+            Order.status.label('order_status'), Order.created_at.label('order_created_at'),
+            Order.total_price)
+        .join(Order, Order.id == RunnerAssignments.order_id)
+        .filter(RunnerAssignments.runner_id == runner_id))
+    if start:
+        query = query.filter(RunnerAssignments.assigned_at >= start)
+    if end:
+        query = query.filter(RunnerAssignments.assigned_at < end)
+    if cursor:
+        try:
+            at, last_id = datetime.fromisoformat(cursor["at"]), int(cursor["id"])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            RunnerAssignments.assigned_at < at,
+            and_(RunnerAssignments.assigned_at == at, RunnerAssignments.id < last_id)))
+    query = query.order_by(RunnerAssignments.assigned_at.desc(), RunnerAssignments.id.desc())
+
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for row in query.yield_per(1000):
+                yield json.dumps(_history_row(row)) + "\n"
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    if limit is None:
+        return jsonify([_history_row(a) for a in query]), 200
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor({"at": last.assigned_at.isoformat(), "id": last.id})
+    return jsonify({"history": [_history_row(a) for a in rows[:limit]], "next_cursor": next_cursor}), 200
+
+def _history_row(a):
+    return {
+        "assignment_id":     a.id,
+        "order_id":          a.order_id,
+        "order_status":      a.order_status,
+        "order_created_at":  a.order_created_at.isoformat(),
+        "total_price":       a.total_price,
+        "assigned_at":       a.assigned_at.isoformat(),
+        "picked_up_at":      a.picked_up_at.isoformat() if a.picked_up_at else None,
+        "delivered_at":      a.delivered_at.isoformat() if a.delivered_at else None,
+        "assignment_status": a.status
+    }
+
+
+# Delivery time percentiles (p50/p90/p99, minutes from order to delivery)
+# ?group=runner|day|runner_day  ?from=&to=  ?runner_id=  ?limit=
+# Admins see everyone; a runner may query their own runner_id.
+@runner_bp.route('/analytics/delivery_times', methods=['GET'])
+@role_required("admin", "runner")
+def delivery_times():
+    group = request.args.get('group', 'runner')
+    if group not in ('runner', 'day', 'runner_day'):
+        return jsonify({"error": "group must be runner, day or runner_day"}), 400
+    try:
+        start, end = parse_date_range(request.args)
+        limit = parse_limit(request.args.get('limit'), default=100, maximum=1000)
+        runner_id = request.args.get('runner_id', type=int)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if current_role() != 'admin' and runner_id != current_user_id():
+        return jsonify({"error": "Unauthorized"}), 403
+
+    rows = delivery_percentiles(group, start=start and start.date(), end=end and end.date(),
+                                runner_id=runner_id, limit=limit)
+    return jsonify({"group": group, "rows": rows}), 200
+
+
+# DeliveryAnalytics is filled in after the transition commits (app/events.py)
+@subscribe("delivery.status_changed")
+def _record_delivery_analytics(event):
+    if event["status"] not in ('picked_up', 'delivered'):
+        return
+    ra = RunnerAssignments.query.get(event["assignment_id"])
+    if ra:
+        record_delivery_transition(ra, event["status"], datetime.fromisoformat(event["at"]))
 
 
 #regiter runner 
 @runner_bp.route('/register', methods=['POST'])
-@jwt_required()
+@role_required("admin")
 def register_runner():
-    admin_id = get_jwt_identity()
-    if not is_admin(admin_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     data = request.get_json() or {}
 
     name = data.get("name", "").strip()
@@ -246,7 +458,7 @@ def register_runner():
     if User.query.filter_by(phone=phone).first():
         return jsonify({"error": "Phone number already exists"}), 400
 
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
     new_runner = User(
         name=name,
         email=email,
@@ -258,6 +470,7 @@ def register_runner():
     db.session.add(new_runner)
     try:
         db.session.commit()
+        invalidate_runner_list()
     except Exception as e:
         db.session.rollback()
         print("Error committing to the database:", e)
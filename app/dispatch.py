@@ -0,0 +1,259 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, exists, insert, or_
+
+from app import app
+from app.geo import haversine_km
+from app.models import db, Address, Order, RunnerAssignments, RunnerLocation, User
+
+logger = logging.getLogger(__name__)
+
+# Batch dispatch: match every unassigned order to a free runner at once.
+#
+# Orders and runners are read with a constant number of queries, a cost
+# matrix (travel minutes minus a bonus for how long the order has waited) is
+# solved as a rectangular assignment problem, and all RunnerAssignments rows
+# are inserted in one transaction. Runs from the admin endpoint
+# (POST /runner/dispatch) or periodically via `flask dispatch run --interval`.
+
+DISPATCHABLE_STATUSES = ["Pending", "Paid", "Processing"]
+ACTIVE_ASSIGNMENT_STATUSES = ["assigned", "picked_up", "delivered"]
+OPEN_ASSIGNMENT_STATUSES = ["assigned", "picked_up"]
+INFEASIBLE = 1e9
+
+
+def _solve_hungarian(cost):
+    # Shortest augmenting path Hungarian algorithm, O(n^2 m) for n <= m.
+    # Returns the column assigned to each row.
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+    assignment = [-1] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def solve_assignment(cost):
+    # Minimum-cost matching of rows to columns for a rectangular matrix;
+    # returns [(row, col), ...]. Uses SciPy when it is installed.
+    if not cost or not cost[0]:
+        return []
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        linear_sum_assignment = None
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    if len(cost) <= len(cost[0]):
+        return [(i, j) for i, j in enumerate(_solve_hungarian(cost)) if j >= 0]
+    transposed = [list(col) for col in zip(*cost)]
+    return [(i, j) for j, i in enumerate(_solve_hungarian(transposed)) if i >= 0]
+
+
+def _pending_orders():
+    taken = exists().where(and_(
+        RunnerAssignments.order_id == Order.id,
+        RunnerAssignments.status.in_(ACTIVE_ASSIGNMENT_STATUSES)))
+    rows = (db.session.query(Order.id, Order.user_id, Order.created_at,
+                             Address.latitude, Address.longitude)
+            .outerjoin(Address, Address.id == Order.address_id)
+            .filter(Order.status.in_(DISPATCHABLE_STATUSES), ~taken)
+            .order_by(Order.created_at)
+            .all())
+
+    # Older orders have no address_id: fall back to the customer's first
+    # address with coordinates, for all of them in one query.
+    missing = {r.user_id for r in rows if r.latitude is None}
+    fallback = {}
+    if missing:
+        for a in (Address.query
+                  .filter(Address.user_id.in_(missing), Address.latitude.isnot(None))
+                  .order_by(Address.id)):
+            fallback.setdefault(a.user_id, (a.latitude, a.longitude))
+
+    orders = []
+    for r in rows:
+        point = (r.latitude, r.longitude) if r.latitude is not None else fallback.get(r.user_id)
+        orders.append({"order_id": r.id, "created_at": r.created_at, "point": point})
+    return orders
+
+
+def _free_runners(max_age):
+    busy = exists().where(and_(
+        RunnerAssignments.runner_id == User.id,
+        RunnerAssignments.status.in_(OPEN_ASSIGNMENT_STATUSES)))
+    query = (db.session.query(User.id, User.name, RunnerLocation.latitude, RunnerLocation.longitude)
+             .join(RunnerLocation, RunnerLocation.runner_id == User.id)
+             .filter(User.role == "runner", User.isActive == True, ~busy))
+    if max_age:
+        query = query.filter(RunnerLocation.updated_at >= datetime.utcnow() - max_age)
+    return [{"runner_id": r.id, "name": r.name, "point": (r.latitude, r.longitude)} for r in query]
+
+
+def build_cost_matrix(orders, runners, now, speed_kmh, wait_weight, max_km):
+    cost, distance = [], []
+    for o in orders:
+        waited = (now - o["created_at"]).total_seconds() / 60 if o["created_at"] else 0
+        row_cost, row_dist = [], []
+        for r in runners:
+            d = haversine_km(o["point"][0], o["point"][1], r["point"][0], r["point"][1])
+            row_dist.append(d)
+            if max_km and d > max_km:
+                row_cost.append(INFEASIBLE)
+            else:
+                row_cost.append(d / speed_kmh * 60 - wait_weight * waited)
+        cost.append(row_cost)
+        distance.append(row_dist)
+    return cost, distance
+
+
+def plan_dispatch():
+    cfg = app.config
+    max_age_min = cfg.get("DISPATCH_MAX_LOCATION_AGE_MINUTES", 30)
+    orders = _pending_orders()
+    total_orders = len(orders)
+    runners = _free_runners(timedelta(minutes=max_age_min) if max_age_min else None)
+
+    unassigned = [{"order_id": o["order_id"], "reason": "no delivery coordinates"}
+                  for o in orders if o["point"] is None]
+    orders = [o for o in orders if o["point"] is not None]
+
+    began = time.perf_counter()
+    cost, distance = build_cost_matrix(
+        orders, runners, datetime.utcnow(),
+        speed_kmh=cfg.get("DISPATCH_SPEED_KMH", 20.0),
+        wait_weight=cfg.get("DISPATCH_WAIT_WEIGHT", 0.5),
+        max_km=cfg.get("DISPATCH_MAX_KM", 15.0))
+    pairs = [(i, j) for i, j in solve_assignment(cost) if cost[i][j] < INFEASIBLE]
+    solve_ms = (time.perf_counter() - began) * 1000
+
+    matched = {i for i, _ in pairs}
+    assignments = [{
+        "order_id": orders[i]["order_id"],
+        "runner_id": runners[j]["runner_id"],
+        "runner_name": runners[j]["name"],
+        "distance_km": round(distance[i][j], 3),
+    } for i, j in pairs]
+    unassigned += [{"order_id": o["order_id"],
+                    "reason": "no free runner in range" if runners else "no free runner"}
+                   for i, o in enumerate(orders) if i not in matched]
+
+    return {
+        "orders": total_orders,
+        "free_runners": len(runners),
+        "assignments": assignments,
+        "unassigned": unassigned,
+        "total_distance_km": round(sum(a["distance_km"] for a in assignments), 3),
+        "solve_ms": round(solve_ms, 2),
+    }
+
+
+def run_dispatch(dry_run=False):
+    plan = plan_dispatch()
+    plan["dry_run"] = dry_run
+    if dry_run or not plan["assignments"]:
+        return plan
+
+    # Orders or runners may have been assigned by hand since the plan was
+    # read; drop those pairs rather than double-booking.
+    order_ids = [a["order_id"] for a in plan["assignments"]]
+    runner_ids = [a["runner_id"] for a in plan["assignments"]]
+    clash = (RunnerAssignments.query
+             .filter(RunnerAssignments.status.in_(ACTIVE_ASSIGNMENT_STATUSES))
+             .filter(or_(
+                 RunnerAssignments.order_id.in_(order_ids),
+                 and_(RunnerAssignments.runner_id.in_(runner_ids),
+                      RunnerAssignments.status.in_(OPEN_ASSIGNMENT_STATUSES))))
+             .all())
+    taken_orders = {c.order_id for c in clash}
+    busy_runners = {c.runner_id for c in clash if c.status in OPEN_ASSIGNMENT_STATUSES}
+    rows = [a for a in plan["assignments"]
+            if a["order_id"] not in taken_orders and a["runner_id"] not in busy_runners]
+    plan["skipped_conflicts"] = len(plan["assignments"]) - len(rows)
+    plan["assignments"] = rows
+
+    now = datetime.utcnow()
+    if rows:
+        db.session.execute(insert(RunnerAssignments), [
+            {"order_id": a["order_id"], "runner_id": a["runner_id"],
+             "assigned_at": now, "status": "assigned"} for a in rows
+        ])
+    db.session.commit()
+    return plan
+
+
+dispatch_cli = AppGroup("dispatch", help="Batch runner dispatch")
+
+
+@dispatch_cli.command("run")
+@click.option("--dry-run", is_flag=True, help="Plan only, write nothing.")
+@click.option("--interval", type=float, default=0, help="Repeat every N seconds (0 = run once).")
+def dispatch_command(dry_run, interval):
+    from app.delivery_boy import invalidate_runner_list
+
+    while True:
+        try:
+            plan = run_dispatch(dry_run=dry_run)
+            if not dry_run and plan["assignments"]:
+                invalidate_runner_list()
+            click.echo(f"{datetime.utcnow().isoformat()} orders={plan['orders']} "
+                       f"runners={plan['free_runners']} assigned={len(plan['assignments'])} "
+                       f"km={plan['total_distance_km']} solve={plan['solve_ms']}ms"
+                       f"{' (dry run)' if dry_run else ''}")
+        except Exception:
+            db.session.rollback()
+            logger.exception("dispatch run failed")
+            if not interval:
+                raise
+        finally:
+            db.session.remove()
+        if not interval:
+            break
+        time.sleep(interval)
@@ -0,0 +1,272 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, event, func, or_, update
+from sqlalchemy.orm import Session
+
+from app import app
+from app.models import db, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Order lifecycle event bus with a transactional outbox.
+#
+# publish() adds an OutboxEvent row to the caller's session, so the event
+# commits (or rolls back) together with the state change that caused it.
+# After the commit a dispatcher thread claims due events and hands each to
+# a thread pool. All subscribers of an event run in one transaction that
+# also marks the event done, so their database writes apply exactly once;
+# if any subscriber raises, everything rolls back and the event is retried
+# with exponential backoff until OUTBOX_MAX_ATTEMPTS, then dead-lettered.
+# Subscribers that reach outside the database (mail, push) must tolerate
+# being called more than once. They must not commit; work that has to wait
+# for the commit (cache invalidation) goes through on_commit().
+
+_handlers = {}
+
+
+def subscribe(topic):
+    def register(fn):
+        _handlers.setdefault(topic, []).append(fn)
+        return fn
+    return register
+
+
+def on_commit(fn):
+    # Runs fn after the delivering transaction commits; dropped on rollback.
+    db.session.info.setdefault("outbox_on_commit", []).append(fn)
+
+
+def publish(topic, **payload):
+    db.session.add(OutboxEvent(topic=topic, payload=json.dumps(payload, default=str),
+                               status="pending", attempts=0, next_attempt_at=datetime.utcnow()))
+    db.session.info["outbox_pending"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop("outbox_pending", False):
+        dispatcher.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("outbox_pending", None)
+
+
+def _retry_delay(attempts):
+    base = app.config.get("OUTBOX_RETRY_BASE_SECONDS", 2)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+class OutboxDispatcher:
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+
+    def wake(self):
+        # Only nudges a running dispatcher; where none runs (web workers with
+        # OUTBOX_DISPATCH_IN_WEB off, CLI commands) `flask events run` polls.
+        self._wake.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._pool = ThreadPoolExecutor(max_workers=app.config.get("EVENT_WORKERS", 4),
+                                            thread_name_prefix="outbox-worker")
+            self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with app.app_context():
+                try:
+                    for event_id, token in self.claim():
+                        with self._lock:
+                            self._in_flight.add(event_id)
+                        self._pool.submit(self._deliver, event_id, token)
+                except Exception:
+                    logger.exception("outbox poll failed")
+                finally:
+                    db.session.remove()
+            self._wake.wait(app.config.get("OUTBOX_POLL_SECONDS", 1.0))
+            self._wake.clear()
+
+    def claim(self, limit=None):
+        # Leases due events to this process with one conditional UPDATE per
+        # event; a lease that expires (worker died) makes it due again.
+        limit = limit or app.config.get("OUTBOX_BATCH_SIZE", 100)
+        now = datetime.utcnow()
+        with self._lock:
+            busy = set(self._in_flight)
+        ids = [row.id for row in (db.session.query(OutboxEvent.id)
+               .filter(OutboxEvent.status.in_(["pending", "processing"]),
+                       OutboxEvent.next_attempt_at <= now)
+               .order_by(OutboxEvent.next_attempt_at, OutboxEvent.id)
+               .limit(limit)) if row.id not in busy]
+        lease = now + timedelta(seconds=app.config.get("OUTBOX_LEASE_SECONDS", 60))
+        claimed = []
+        for event_id in ids:
+            token = uuid.uuid4().hex
+            result = db.session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id == event_id,
+                       OutboxEvent.status.in_(["pending", "processing"]),
+                       OutboxEvent.next_attempt_at <= now)
+                .values(status="processing", claimed_by=token, next_attempt_at=lease))
+            if result.rowcount == 1:
+                claimed.append((event_id, token))
+        db.session.commit()
+        return claimed
+
+    def _deliver(self, event_id, token):
+        with app.app_context():
+            try:
+                self.deliver(event_id, token)
+            except Exception:
+                logger.exception("outbox event %s delivery crashed", event_id)
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._in_flight.discard(event_id)
+
+    def deliver(self, event_id, token):
+        ev = db.session.get(OutboxEvent, event_id)
+        if ev is None or ev.claimed_by != token:
+            return
+        db.session.info.pop("outbox_on_commit", None)
+        topic, payload = ev.topic, json.loads(ev.payload)
+        try:
+            for handler in _handlers.get(topic, []):
+                handler(payload)
+            done = db.session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id == event_id, OutboxEvent.claimed_by == token)
+                .values(status="done", processed_at=datetime.utcnow(), last_error=None))
+            if done.rowcount != 1:
+                db.session.rollback()  # lease was lost to another worker
+                db.session.info.pop("outbox_on_commit", None)
+                return
+            db.session.commit()
+            with self._lock:
+                self.delivered += 1
+            for fn in db.session.info.pop("outbox_on_commit", []):
+                try:
+                    fn()
+                except Exception:
+                    logger.exception("outbox on_commit callback failed for event %s", event_id)
+        except Exception as e:
+            db.session.rollback()
+            db.session.info.pop("outbox_on_commit", None)
+            ev = db.session.get(OutboxEvent, event_id)
+            if ev is None or ev.claimed_by != token:
+                return
+            ev.attempts += 1
+            ev.last_error = f"{type(e).__name__}: {e}"[:2000]
+            if ev.attempts >= app.config.get("OUTBOX_MAX_ATTEMPTS", 5):
+                ev.status = "dead"
+                logger.error("outbox event %s (%s) dead-lettered: %s", event_id, topic, ev.last_error)
+            else:
+                ev.status = "pending"
+                ev.next_attempt_at = datetime.utcnow() + _retry_delay(ev.attempts)
+            db.session.commit()
+            with self._lock:
+                if ev.status == "dead":
+                    self.dead += 1
+                else:
+                    self.retried += 1
+
+    def drain(self):
+        # Delivers everything due, in this thread; for the CLI worker.
+        count = 0
+        while True:
+            claimed = self.claim()
+            if not claimed:
+                return count
+            for event_id, token in claimed:
+                self.deliver(event_id, token)
+                count += 1
+
+    def stats(self):
+        counts = dict(db.session.query(OutboxEvent.status, func.count(OutboxEvent.id))
+                      .group_by(OutboxEvent.status).all())
+        overdue = (db.session.query(func.count(OutboxEvent.id))
+                   .filter(or_(OutboxEvent.status == "pending",
+                               and_(OutboxEvent.status == "processing",
+                                    OutboxEvent.next_attempt_at < datetime.utcnow())))
+                   .scalar())
+        with self._lock:
+            return {"by_status": counts, "due_or_waiting": overdue, "in_flight": len(self._in_flight),
+                    "delivered": self.delivered, "retried": self.retried, "dead_lettered": self.dead}
+
+
+dispatcher = OutboxDispatcher()
+
+
+@app.before_request
+def _start_dispatcher():
+    # Picks up events left by a previous process without waiting for a new
+    # publish.
+    if dispatcher._thread is None and app.config.get("OUTBOX_DISPATCH_IN_WEB", True):
+        dispatcher.start()
+
+
+def retry_dead(event_id=None):
+    query = OutboxEvent.query.filter(OutboxEvent.status == "dead")
+    if event_id is not None:
+        query = query.filter(OutboxEvent.id == event_id)
+    count = query.update({"status": "pending", "attempts": 0, "claimed_by": None,
+                          "next_attempt_at": datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    if count:
+        dispatcher.wake()
+    return count
+
+
+events_cli = AppGroup("events", help="Order event outbox")
+
+
+@events_cli.command("run")
+@click.option("--interval", type=float, default=1.0, help="Poll every N seconds (0 = drain once).")
+def run_command(interval):
+    while True:
+        try:
+            delivered = dispatcher.drain()
+            if delivered or not interval:
+                click.echo(f"{datetime.utcnow().isoformat()} delivered={delivered}")
+        except Exception:
+            db.session.rollback()
+            logger.exception("outbox worker failed")
+            if not interval:
+                raise
+        finally:
+            db.session.remove()
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@events_cli.command("retry-dead")
+@click.option("--id", "event_id", type=int, default=None, help="Only this event.")
+def retry_dead_command(event_id):
+    click.echo(f"requeued {retry_dead(event_id)} dead events")
@@ -0,0 +1,262 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import app
+from app.models import db, RunnerLocation
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# In-memory grid index of runner positions.
+# The map is cut into square cells of `cell_deg` degrees; a nearest lookup
+# scans rings of cells around the query point and stops as soon as no
+# unvisited cell can hold anything closer than the k-th best hit, so its cost
+# depends on local density, not on the number of runners.
+class RunnerLocationIndex:
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._positions = {}   # runner_id -> (lat, lon, updated_at)
+        self._cells = {}       # (ix, iy) -> set(runner_id)
+        self._dirty = set()
+        self._lock = threading.RLock()
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def update(self, runner_id, lat, lon, updated_at=None, dirty=True):
+        updated_at = updated_at or datetime.utcnow()
+        cell = self._cell(lat, lon)
+        with self._lock:
+            old = self._positions.get(runner_id)
+            if old is not None:
+                if old[2] > updated_at:
+                    return  # out-of-order ping
+                old_cell = self._cell(old[0], old[1])
+                if old_cell != cell:
+                    members = self._cells.get(old_cell)
+                    members.discard(runner_id)
+                    if not members:
+                        del self._cells[old_cell]
+            self._cells.setdefault(cell, set()).add(runner_id)
+            self._positions[runner_id] = (lat, lon, updated_at)
+            if dirty:
+                self._dirty.add(runner_id)
+
+    def remove(self, runner_id):
+        with self._lock:
+            old = self._positions.pop(runner_id, None)
+            if old is not None:
+                cell = self._cell(old[0], old[1])
+                self._cells[cell].discard(runner_id)
+                if not self._cells[cell]:
+                    del self._cells[cell]
+            self._dirty.discard(runner_id)
+
+    def get(self, runner_id):
+        return self._positions.get(runner_id)
+
+    def nearest(self, lat, lon, k=5, accept=None, max_km=None):
+        # [(distance_km, runner_id), ...] of the k nearest runners for which
+        # accept(runner_id) is true, closest first.
+        cx, cy = self._cell(lat, lon)
+        # Smallest ground length of one cell around here (longitude shrinks
+        # towards the poles); ring r+1 is at least r of those away.
+        cell_km = self.cell_deg * KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + self.cell_deg, 89.9))), 0.01)
+        max_ring = int(max_km / cell_km) + 1 if max_km else None
+        best = []
+        with self._lock:
+            if not self._positions:
+                return []
+            ring = 0
+            seen_cells = 0
+            while True:
+                for cell in self._ring(cx, cy, ring):
+                    members = self._cells.get(cell)
+                    if not members:
+                        continue
+                    seen_cells += 1
+                    for rid in members:
+                        if accept is not None and not accept(rid):
+                            continue
+                        plat, plon, _ = self._positions[rid]
+                        d = haversine_km(lat, lon, plat, plon)
+                        if max_km is None or d <= max_km:
+                            best.append((d, rid))
+                if len(best) >= k:
+                    best.sort()
+                    del best[k:]
+                    if best[-1][0] <= ring * cell_km:
+                        break
+                if max_ring is not None and ring >= max_ring:
+                    break
+                if seen_cells >= len(self._cells):
+                    break
+                ring += 1
+        best.sort()
+        return best[:k]
+
+    @staticmethod
+    def _ring(cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def take_dirty(self):
+        with self._lock:
+            rows = [
+                {"runner_id": rid, "latitude": self._positions[rid][0],
+                 "longitude": self._positions[rid][1], "updated_at": self._positions[rid][2]}
+                for rid in self._dirty if rid in self._positions
+            ]
+            self._dirty.clear()
+            return rows
+
+
+def persist_locations(rows):
+    # One upsert statement for all dirty positions.
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    table = RunnerLocation.__table__
+    if dialect == "sqlite":
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.runner_id],
+            set_={"latitude": stmt.excluded.latitude, "longitude": stmt.excluded.longitude,
+                  "updated_at": stmt.excluded.updated_at})
+    elif dialect == "mysql":
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            latitude=stmt.inserted.latitude, longitude=stmt.inserted.longitude,
+            updated_at=stmt.inserted.updated_at)
+    else:
+        for row in rows:
+            db.session.merge(RunnerLocation(**row))
+        db.session.commit()
+        return
+    db.session.execute(stmt, rows)
+    db.session.commit()
+
+
+class LocationSync:
+    # Keeps one process's index in step with the runner_location table:
+    # every `interval` seconds its own dirty pings are upserted and rows other
+    # workers wrote since the last pass are pulled in. updated_at is the ping
+    # time, not the write time: another worker can flush a ping up to one
+    # interval after it arrived, behind newer rows already read. Each pass
+    # therefore re-reads a window of `lookback` seconds before the newest
+    # row seen; rows read twice are dropped by the index as out of order.
+
+    def __init__(self, index, interval, lookback=None):
+        self.index = index
+        self.interval = interval
+        self.lookback = timedelta(seconds=lookback if lookback is not None else 3 * interval)
+        self.last_seen = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        query = RunnerLocation.query
+        if self.last_seen is not None:
+            query = query.filter(RunnerLocation.updated_at > self.last_seen - self.lookback)
+        for loc in query.all():
+            if loc.updated_at and (self.last_seen is None or loc.updated_at > self.last_seen):
+                self.last_seen = loc.updated_at
+            self.index.update(loc.runner_id, loc.latitude, loc.longitude,
+                              updated_at=loc.updated_at, dirty=False)
+
+    def sync_once(self):
+        rows = self.index.take_dirty()
+        try:
+            persist_locations(rows)
+        except Exception:
+            db.session.rollback()
+            # put them back so the next pass retries
+            for row in rows:
+                self.index.update(row["runner_id"], row["latitude"], row["longitude"],
+                                  updated_at=row["updated_at"])
+            raise
+        self.load()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    self.sync_once()
+                except Exception:
+                    logger.exception("runner location sync failed")
+                finally:
+                    db.session.remove()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="runner-location-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_index = None
+_sync = None
+_init_lock = threading.Lock()
+
+
+def runner_index():
+    # Built lazily on first use (inside a request), so CLI commands and
+    # migrations never start the sync thread.
+    global _index, _sync
+    if _index is None:
+        with _init_lock:
+            if _index is None:
+                index = RunnerLocationIndex(cell_deg=app.config.get("RUNNER_INDEX_CELL_DEG", 0.01))
+                sync = LocationSync(index, app.config.get("RUNNER_LOCATION_FLUSH_SECONDS", 5),
+                                    lookback=app.config.get("RUNNER_LOCATION_LOOKBACK_SECONDS"))
+                sync.load()
+                sync.start()
+                _index, _sync = index, sync
+    return _index
+
+
+def timed_nearest(index, lat, lon, k, accept=None, max_km=None):
+    began = time.perf_counter()
+    hits = index.nearest(lat, lon, k=k, accept=accept, max_km=max_km)
+    return hits, (time.perf_counter() - began) * 1000
+
+
+def order_location(order):
+    # Delivery coordinates of an order: the address picked at checkout, or
+    # for older orders the customer's first address that has coordinates.
+    if order.address is not None and order.address.latitude is not None:
+        return order.address.latitude, order.address.longitude
+    for address in order.user.addresses:
+        if address.latitude is not None and address.longitude is not None:
+            return address.latitude, address.longitude
+    return None
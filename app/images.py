@@ -0,0 +1,168 @@
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import threading
+
+import click
+from flask.cli import AppGroup
+
+from app import app
+from app.catalog import invalidate_catalog
+from app.events import on_commit, publish, subscribe
+from app.models import db, Product
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # without Pillow uploads are stored as sent, with no variants
+    Image = ImageOps = None
+
+# Product image pipeline.
+#
+# An upload is stored under the hash of its bytes (<hash>.<ext>) and a
+# "product.image_uploaded" event is published with the product change.
+# The outbox workers (app/events.py) then render each size in VARIANTS as
+# WebP and JPEG, <hash>-<size>.<format>, and record their URLs in
+# Product.image_variants, so list pages can fetch a thumbnail instead of
+# the original. Names depend only on the content, so a retried event
+# rewrites the same files, and serve_image can let clients cache them
+# forever. `flask images build` renders variants for existing products.
+
+VARIANTS = {"thumb": 160, "medium": 480, "large": 1080}  # longest side, px
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+HASHED_NAME = re.compile(r"^[0-9a-f]{16}(-[a-z]+)?\.[a-z0-9]+$")
+IMAGE_URL_PREFIX = "/api/img/"
+
+mimetypes.add_type("image/webp", ".webp")  # absent from some older mimetypes tables
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _folder():
+    return app.config["UPLOAD_FOLDER"]
+
+
+def _tmp_name(path):
+    # per writer, so two workers rendering the same content never share one
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def save_upload(file_storage):
+    # Stores an uploaded image under its content hash; returns its URL.
+    data = file_storage.read()
+    if not data:
+        raise InvalidImage("Empty image")
+    ext = os.path.splitext(file_storage.filename or "")[1].lower()
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img.verify()
+                ext = "." + {"JPEG": "jpg"}.get(img.format, img.format.lower())
+        except Exception:
+            raise InvalidImage("Unsupported or corrupt image")
+    filename = _content_hash(data) + (ext or ".bin")
+    path = os.path.join(_folder(), filename)
+    if not os.path.exists(path):
+        tmp = _tmp_name(path)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return IMAGE_URL_PREFIX + filename
+
+
+def queue_variants(product):
+    # Call before the commit that stores product.image_url.
+    product.image_variants = None
+    if product.image_url and product.image_url.startswith(IMAGE_URL_PREFIX):
+        db.session.flush()
+        publish("product.image_uploaded", product_id=product.id, image_url=product.image_url)
+
+
+def _save(img, path, fmt):
+    tmp = _tmp_name(path)
+    if fmt == "JPEG":
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            flat = Image.new("RGB", rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.getchannel("A"))
+            img = flat
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(tmp, "JPEG", quality=app.config.get("IMAGE_JPEG_QUALITY", 82), optimize=True, progressive=True)
+    else:
+        img.save(tmp, "WEBP", quality=app.config.get("IMAGE_WEBP_QUALITY", 80), method=4)
+    os.replace(tmp, path)
+
+
+def render_variants(image_url):
+    # -> {"thumb": {"width", "height", "webp", "jpeg"}, ...}; every size is
+    # rendered from the original with LANCZOS, never upscaled.
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    source = os.path.join(_folder(), os.path.basename(image_url))
+    with open(source, "rb") as f:
+        digest = _content_hash(f.read())
+    variants = {}
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "A" in original.getbands() or
+                                        "transparency" in original.info else "RGB")
+        for size, edge in VARIANTS.items():
+            img = original.copy()
+            img.thumbnail((edge, edge), Image.LANCZOS)
+            entry = {"width": img.width, "height": img.height}
+            for key, fmt in FORMATS.items():
+                filename = f"{digest}-{size}.{key}"
+                path = os.path.join(_folder(), filename)
+                if not os.path.exists(path):
+                    _save(img, path, fmt)
+                entry[key] = IMAGE_URL_PREFIX + filename
+            variants[size] = entry
+    return variants
+
+
+@subscribe("product.image_uploaded")
+def _build_variants(event):
+    if Image is None:
+        return
+    product = db.session.get(Product, event["product_id"])
+    if product is None or product.image_url != event["image_url"]:
+        return  # deleted, or the image was replaced again since
+    variants = render_variants(event["image_url"])
+    product.image_variants = json.dumps(variants, separators=(",", ":"))
+    on_commit(lambda: invalidate_catalog([event["product_id"]], carts=False))
+
+
+images_cli = AppGroup("images", help="Product image variants")
+
+
+@images_cli.command("build")
+@click.option("--all", "rebuild", is_flag=True, help="Also products that already have variants.")
+def build_command(rebuild):
+    if Image is None:
+        raise click.ClickException("Pillow is not installed")
+    query = Product.query.filter(Product.image_url.like(IMAGE_URL_PREFIX + "%"))
+    if not rebuild:
+        query = query.filter(Product.image_variants.is_(None))
+    built = failed = 0
+    for product in query.all():
+        try:
+            product.image_variants = json.dumps(render_variants(product.image_url), separators=(",", ":"))
+            db.session.commit()
+            built += 1
+        except Exception as e:
+            db.session.rollback()
+            failed += 1
+            click.echo(f"product {product.id} ({product.image_url}): {e}")
+    if built:
+        invalidate_catalog(carts=False)
+    click.echo(f"built variants for {built} products, {failed} failed")
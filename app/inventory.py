@@ -1,23 +1,15 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, User, Product, Inventory
+from app.models import db, Product, Inventory
 from datetime import datetime
+from app.authz import role_required
+from app.catalog import invalidate_catalog
 
 inventory_bp = Blueprint("inventory", __name__, url_prefix="/inventory")
 
-# Helper to validate admin
-def is_admin(user_id):
-    user = User.query.get(user_id)
-    return user and user.role == "admin"
-
 # Reset stock for all products (default: 100)
 @inventory_bp.route("/reset_all", methods=["PUT"])
-@jwt_required()
+@role_required("admin")
 def reset_all_inventory():
-    user_id = get_jwt_identity()
-    if not is_admin(user_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     default_stock = 100
 
     # Reset in Inventory
@@ -32,17 +24,14 @@ def reset_all_inventory():
             product.stock = default_stock
 
     db.session.commit()
+    invalidate_catalog(carts=False)
     return jsonify({"message": f"All inventory reset to {default_stock} successfully."}), 200
 
 
 # Reset stock for a specific product_id
 @inventory_bp.route("/reset/<int:product_id>", methods=["PUT"])
-@jwt_required()
+@role_required("admin")
 def reset_single_inventory(product_id):
-    user_id = get_jwt_identity()
-    if not is_admin(user_id):
-        return jsonify({"error": "Unauthorized"}), 403
-
     default_stock = 100
 
     inv = Inventory.query.filter_by(product_id=product_id).first()
@@ -57,4 +46,5 @@ def reset_single_inventory(product_id):
         product.stock = default_stock
 
     db.session.commit()
+    invalidate_catalog(carts=False)
     return jsonify({"message": f"Inventory for product_id {product_id} reset to {default_stock}."}), 200
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy import SQLAlchemy
+import json
 from datetime import datetime, date
 
 db = SQLAlchemy()
@@ -14,6 +15,7 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False, default="user") # user, admin, runner
     isActive = db.Column(db.Boolean, default=True)  # New field to track user activity  
+    authz_changed_at = db.Column(db.Integer, nullable=True)  # epoch seconds of the last role/isActive change (app/authz.py)
 
     def to_dict(self):
         return {
@@ -45,10 +47,14 @@ class Address(db.Model):
     state = db.Column(db.String(100), nullable=False)
     zip_code = db.Column(db.String(20), nullable=False)
     country = db.Column(db.String(100), nullable=False)
+    latitude = db.Column(db.Float, nullable=True)   # set by the client when known; used for dispatch
+    longitude = db.Column(db.Float, nullable=True)
 
 # Product Model
 class Product(db.Model):
-
+    __table_args__ = (
+        db.Index('ix_product_category_id', 'category', 'id'),  # category filter, ordered by id
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
@@ -58,6 +64,7 @@ class Product(db.Model):
     stock = db.Column(db.Integer, nullable=False, default=0)
     category = db.Column(db.String(100), nullable=False)
     image_url = db.Column(db.String(255), nullable=True)
+    image_variants = db.Column(db.Text, nullable=True)  # JSON, filled by app/images.py
 
     def to_dict(self):
         return {
@@ -68,13 +75,18 @@ class Product(db.Model):
         "price": self.price,
         "unit": self.unit,
         "stock": self.stock,
-        "image_url": self.image_url or ""
+        "image_url": self.image_url or "",
+        "image_variants": json.loads(self.image_variants) if self.image_variants else {}
         }
 
 
 
 # Cart Model 
 class Cart(db.Model):
+    __table_args__ = (
+        # one line per product; also serves lookups by user_id alone
+        db.UniqueConstraint('user_id', 'product_id', name='uq_cart_user_product'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -86,9 +98,15 @@ class Cart(db.Model):
 
 # Order Model
 class Order(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_user_created', 'user_id', 'created_at'),
+        db.Index('ix_order_created_id', 'created_at', 'id'),
+        db.Index('ix_order_status_created', 'status', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    address_id = db.Column(db.Integer, db.ForeignKey('address.id', ondelete='SET NULL'), nullable=True)  # delivery address chosen at checkout; NULL once the address is deleted
     total_price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), default="Pending")  # Pending, Processing, Out_for_delivery, Delivered, Cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -99,9 +117,13 @@ class Order(db.Model):
     runner_assignments = db.relationship('RunnerAssignments', backref='order', lazy=True)
     delivery_analytics = db.relationship('DeliveryAnalytics', backref='order', lazy=True, uselist=False)
     status_history = db.relationship('OrderStatusHistory', backref='order', lazy=True)
+    address = db.relationship('Address', lazy=True)
 
 # Inventory Model 
 class Inventory(db.Model):
+    __table_args__ = (
+        db.Index('ix_inventory_product', 'product_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -114,6 +136,9 @@ class Inventory(db.Model):
 
 
 class OrderItems(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_items_order', 'order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -125,6 +150,11 @@ class OrderItems(db.Model):
 
 # RunnerAssignments Model 
 class RunnerAssignments(db.Model):
+    __table_args__ = (
+        db.Index('ix_runner_assignments_runner_status', 'runner_id', 'status'),
+        db.Index('ix_runner_assignments_runner_assigned', 'runner_id', 'assigned_at', 'id'),
+        db.Index('ix_runner_assignments_order', 'order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -136,6 +166,9 @@ class RunnerAssignments(db.Model):
 
 # Payments Model (tracks payment details for an order)
 class Payments(db.Model):
+    __table_args__ = (
+        db.Index('ix_payments_order', 'order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -160,7 +193,11 @@ class RunnerLocation(db.Model):
 
 # DeliveryAnalytics Model (tracks delivery time metrics for each order)
 class DeliveryAnalytics(db.Model):
-    
+    __table_args__ = (
+        db.Index('ix_delivery_analytics_delivered_on', 'delivered_on', 'runner_id'),
+        db.Index('ix_delivery_analytics_runner_delivered', 'runner_id', 'delivered_on'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -168,6 +205,9 @@ class DeliveryAnalytics(db.Model):
     order_placed_at = db.Column(db.DateTime, nullable=False)
     order_picked_at = db.Column(db.DateTime, nullable=True)
     order_delivered_at = db.Column(db.DateTime, nullable=True)
+    # filled in on delivery so reports can group and rank without date math
+    delivery_minutes = db.Column(db.Float, nullable=True)
+    delivered_on = db.Column(db.Date, nullable=True)
 # Track metrics such as product views, cart abandonment rates, and average cart size to optimize product offerings and user experience.
     @property
     def delivery_duration_minutes(self):
@@ -177,6 +217,9 @@ class DeliveryAnalytics(db.Model):
 
 # OrderStatusHistory Model (logs every change in an order's status)
 class OrderStatusHistory(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_status_history_order_changed', 'order_id', 'changed_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -184,6 +227,22 @@ class OrderStatusHistory(db.Model):
     new_status = db.Column(db.String(50), nullable=False)
     changed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# OrderSummary Model (one compact row per order for the order history screen)
+# Written in the same transaction as the order and its status changes, so
+# a user's newest orders are one range scan over (user_id, created_at).
+class OrderSummary(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_summary_user_created', 'user_id', 'created_at', 'order_id'),
+    )
+
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    total_price = db.Column(db.Float, nullable=False)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    preview = db.Column(db.String(255), nullable=True)  # first few product names
+
 # ProductViews Model (tracks when a product is viewed by a user)
 class ProductViews(db.Model):
     
@@ -194,9 +253,58 @@ class ProductViews(db.Model):
 
 # ProductSales Model (aggregates daily sales data for each product)
 class ProductSales(db.Model):
-    
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'recorded_on', name='uq_product_sales_product_day'),
+        db.Index('ix_product_sales_recorded_on', 'recorded_on'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity_sold = db.Column(db.Integer, nullable=False)
     total_revenue = db.Column(db.Float, nullable=False)
     recorded_on = db.Column(db.Date, default=date.today)
+
+# ProductSalesBackfill Model (staging copy of ProductSales filled by
+# `flask sales rollup --backfill`, then swapped in; see app/sales.py)
+class ProductSalesBackfill(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'recorded_on', name='uq_product_sales_backfill_product_day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity_sold = db.Column(db.Integer, nullable=False)
+    total_revenue = db.Column(db.Float, nullable=False)
+    recorded_on = db.Column(db.Date, nullable=False)
+
+# RollupState Model (high-water marks of incremental aggregation jobs)
+class RollupState(db.Model):
+
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# OutboxEvent Model (order lifecycle events awaiting their subscribers)
+class OutboxEvent(db.Model):
+    __table_args__ = (
+        db.Index('ix_outbox_event_status_due', 'status', 'next_attempt_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, processing, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+# RevokedToken Model (logged-out tokens and sessions, used refresh tokens,
+# password-change cutoffs; see app/tokens.py)
+class RevokedToken(db.Model):
+
+    key = db.Column(db.String(80), primary_key=True)  # jti:<jti>, sid:<sid>, used:<jti>, user:<id>
+    revoked_at = db.Column(db.Float, nullable=False)  # epoch seconds, sub-second
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # safe to purge after this
@@ -1,12 +1,25 @@
 # newest code for order
 
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import csv
+import io
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import get_jwt_identity
 from datetime import datetime
-from app import db
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, selectinload
+from app import app, db
+from app.authz import current_role, current_user_id, role_required
+from app.cart import invalidate_cart
+from app.catalog import invalidate_catalog
+from app.events import on_commit, publish, subscribe
+from app.order_summary import add_order_summary, set_summary_status
+from app.pagination import decode_cursor, encode_cursor, parse_date_range, parse_limit, wants_page
+from app.stock import StockConflict, backoff, is_lock_conflict, release_stock, reserve_stock, stock_metrics
 from app.models import (
     User, Product, Cart, Order, OrderItems,
-    Address, Inventory, OrderStatusHistory, Payments, RunnerAssignments
+    Address, OrderStatusHistory, OrderSummary, Payments, RunnerAssignments
 )
 
 order_bp = Blueprint("order", __name__, url_prefix="/orders")
@@ -20,8 +33,12 @@ def _record_history(order, old_status, new_status):
     ))
 
 # Place an order
+# Round trips are constant in the cart size and no row lock is held while the
+# order is assembled: stock is reserved by one conditional UPDATE
+# (app/stock.py). A checkout that loses the race for a SKU rolls back and
+# retries on a fresh read, a bounded number of times.
 @order_bp.route("/place", methods=["POST"])
-@jwt_required()
+@role_required()
 def place_order():
     user_id = get_jwt_identity()
     data = request.get_json() or {}
@@ -32,41 +49,72 @@ def place_order():
     if not address:
         return jsonify({"error": "Invalid or unauthorized address"}), 400
 
+    address_id = address.id
+    attempts = app.config.get("STOCK_RETRY_ATTEMPTS", 5)
+    for attempt in range(attempts):
+        try:
+            return _checkout(user_id, address_id, data)
+        except StockConflict as e:
+            db.session.rollback()
+            stock_metrics.conflict(e.product_ids)
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_lock_conflict(e):
+                raise  # connection loss, schema errors, ...: a 500, not a retry
+            stock_metrics.add("lock_errors")
+        if attempt + 1 < attempts:
+            stock_metrics.add("retries")
+            backoff(attempt)
+
+    stock_metrics.add("exhausted")
+    return jsonify({"error": "Too many concurrent checkouts, please retry"}), 409
+
+def _checkout(user_id, address_id, data):
     cart_items = Cart.query.filter_by(user_id=user_id).all()
     if not cart_items:
         return jsonify({"error": "Cart is empty"}), 400
 
-    total_price = 0
+    quantities = {}
     for item in cart_items:
-        prod = Product.query.get(item.product_id)
-        if not prod or prod.stock < item.quantity:
-            name = prod.name if prod else item.product_id
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(list(quantities))).all()}
+
+    total_price = 0
+    for product_id, qty in quantities.items():
+        prod = products.get(product_id)
+        if not prod or prod.stock < qty:
+            db.session.rollback()
+            name = prod.name if prod else product_id
             return jsonify({"error": f"Insufficient stock for '{name}'"}), 400
-        total_price += prod.price * item.quantity
+        total_price += prod.price * qty
+
+    # Raises StockConflict if another checkout took the stock since the read
+    reserve_stock(quantities)
 
     initial_status = "Pending" if data["payment_mode"].strip().lower() == "cod" else "Paid"
-    order = Order(user_id=user_id, total_price=total_price, status=initial_status, created_at=datetime.utcnow())
+    order = Order(user_id=user_id, address_id=address_id, total_price=total_price,
+                  status=initial_status, created_at=datetime.utcnow())
     db.session.add(order)
     db.session.flush()
 
     _record_history(order, "Created", initial_status)
 
-    for item in cart_items:
-        db.session.add(OrderItems(
-            order_id=order.id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            price_at_order_time=Product.query.get(item.product_id).price
-        ))
-        p = Product.query.get(item.product_id)
-        p.stock -= item.quantity
-        inv = Inventory.query.filter_by(product_id=p.id).first()
-        if inv:
-            inv.stock -= item.quantity
-            inv.updated_at = datetime.utcnow()
+    db.session.execute(insert(OrderItems), [
+        {
+            "order_id": order.id,
+            "product_id": product_id,
+            "quantity": qty,
+            "price_at_order_time": products[product_id].price,
+        } for product_id, qty in quantities.items()
+    ])
+
+    add_order_summary(order, [products[pid].name for pid in quantities], sum(quantities.values()))
 
     Cart.query.filter_by(user_id=user_id).delete()
     db.session.commit()
+    invalidate_catalog(list(quantities), carts=False)
+    invalidate_cart(user_id)
 
     return jsonify({
         "message": "Order placed successfully",
@@ -76,49 +124,163 @@ def place_order():
     }), 201
 
 # List current user's orders
+# Served from OrderSummary: ?limit/&cursor pages cost one range scan on
+# (user_id, created_at); without them the full list is returned as before.
 @order_bp.route("/userorder", methods=["GET"])
-@jwt_required()
+@role_required()
 def get_user_orders():
-    user_id = get_jwt_identity()
-    orders = (Order.query
-        .filter_by(user_id=user_id)
-        .order_by(Order.created_at.desc())
-        .all()
-    )
-    return jsonify([{
-        "order_id": o.id,
+    user_id = int(get_jwt_identity())
+    try:
+        cursor = decode_cursor(request.args.get("cursor"))
+        limit = parse_limit(request.args.get("limit"), default=20) if wants_page(request.args) else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = OrderSummary.query.filter(OrderSummary.user_id == user_id)
+    if cursor:
+        try:
+            at, last_id = datetime.fromisoformat(cursor["at"]), int(cursor["id"])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            OrderSummary.created_at < at,
+            and_(OrderSummary.created_at == at, OrderSummary.order_id < last_id)))
+    query = query.order_by(OrderSummary.created_at.desc(), OrderSummary.order_id.desc())
+
+    if limit is None:
+        return jsonify([_summary_row(o) for o in query]), 200
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor({"at": last.created_at.isoformat(), "id": last.order_id})
+    return jsonify({"orders": [_summary_row(o) for o in rows[:limit]], "next_cursor": next_cursor}), 200
+
+def _summary_row(o):
+    return {
+        "order_id": o.order_id,
         "total_price": o.total_price,
         "status": o.status,
-        "created_at": o.created_at.isoformat()
-    } for o in orders]), 200
+        "created_at": o.created_at.isoformat(),
+        "item_count": o.item_count,
+        "preview": o.preview
+    }
 
 # Admin: list all orders
 @order_bp.route("/get_all_orders", methods=["GET"])
-@jwt_required()
+@role_required("admin")
 def get_all_orders():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != "admin":
-        return jsonify({"error": "Unauthorized"}), 403
+    # Filters: ?status=Pending,Paid  ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    # Output:  default JSON list, ?limit/&cursor for keyset pages, or
+    #          ?format=ndjson|csv streamed straight off a server-side cursor.
+
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "ndjson", "csv"):
+        return jsonify({"error": "format must be json, ndjson or csv"}), 400
+    try:
+        start, end = parse_date_range(request.args)
+        cursor = decode_cursor(request.args.get("cursor"))
+        limit = parse_limit(request.args.get("limit")) if wants_page(request.args) else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    return jsonify([{
+    query = (db.session.query(
+            Order.id, Order.user_id, User.name.label("user_name"),
+            Order.total_price, Order.status, Order.created_at)
+        .join(User, User.id == Order.user_id))
+    statuses = [s for s in request.args.get("status", "").split(",") if s]
+    if statuses:
+        query = query.filter(Order.status.in_(statuses))
+    if start:
+        query = query.filter(Order.created_at >= start)
+    if end:
+        query = query.filter(Order.created_at < end)
+    if cursor:
+        try:
+            at, last_id = datetime.fromisoformat(cursor["at"]), int(cursor["id"])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            Order.created_at < at,
+            and_(Order.created_at == at, Order.id < last_id)))
+    query = query.order_by(Order.created_at.desc(), Order.id.desc())
+
+    if fmt != "json":
+        rows = query.execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+        if fmt == "ndjson":
+            body = (json.dumps(_order_row(o)) + "\n" for o in rows)
+            return Response(stream_with_context(body), mimetype="application/x-ndjson")
+        headers = {"Content-Disposition": "attachment; filename=orders.csv"}
+        return Response(stream_with_context(_csv_lines(rows)), mimetype="text/csv", headers=headers)
+
+    if limit is None:
+        return jsonify([_order_row(o) for o in query]), 200
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor({"at": last.created_at.isoformat(), "id": last.id})
+    return jsonify({"orders": [_order_row(o) for o in rows[:limit]], "next_cursor": next_cursor}), 200
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ["order_id", "user_id", "user", "total_price", "status", "created_at"]
+
+def _order_row(o):
+    return {
         "order_id": o.id,
         "user_id": o.user_id,
-        "user": o.user.name,
+        "user": o.user_name,
         "total_price": o.total_price,
         "status": o.status,
         "created_at": o.created_at.isoformat()
-    } for o in orders]), 200
+    }
+
+def _csv_lines(rows):
+    # One small buffer flushed every ~8KB, so memory stays flat however many
+    # orders are exported.
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for o in rows:
+        writer.writerow(_order_row(o))
+        if buf.tell() > 8192:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
 
 # Get order details (user or admin), include address for admin
+# Items+products, the customer and the delivery address load in a constant
+# number of queries. ?include=history,payments,delivery folds in what
+# /orders/<id>/history serves, one selectin query per extra section.
+ORDER_INCLUDES = {
+    "history": Order.status_history,
+    "payments": Order.payments,
+    "delivery": Order.runner_assignments,
+}
+
 @order_bp.route("/<int:order_id>", methods=["GET"])
-@jwt_required()
+@role_required()
 def get_order(order_id):
-    me = get_jwt_identity()
-    user = User.query.get(me)
-    order = Order.query.get(order_id)
-    if not order or (order.user_id != me and user.role != "admin"):
+    me = current_user_id()
+
+    include = {part for part in (request.args.get("include") or "").split(",") if part}
+    unknown = include - set(ORDER_INCLUDES)
+    if unknown:
+        return jsonify({"error": f"Unknown include: {', '.join(sorted(unknown))}"}), 400
+
+    is_admin = current_role() == "admin"
+    options = [
+        selectinload(Order.order_items).joinedload(OrderItems.product),
+        joinedload(Order.address),
+    ]
+    if is_admin:
+        options.append(joinedload(Order.user).selectinload(User.addresses))
+    options += [selectinload(ORDER_INCLUDES[name]) for name in include]
+    order = db.session.get(Order, order_id, options=options)
+    if not order or (order.user_id != me and not is_admin):
         return jsonify({"error": "Unauthorized"}), 403
 
     data = {
@@ -137,9 +299,12 @@ def get_order(order_id):
         ]
     }
 
-    if user.role == "admin":
-        addr = Address.query.filter_by(id=order.user.addresses[0].id).first()
-        data["shipping_address"] = {
+    if is_admin:
+        # the address picked at checkout; orders placed before it was
+        # recorded, or whose address was since deleted, fall back to the
+        # customer's first saved address
+        addr = order.address or (order.user.addresses[0] if order.user.addresses else None)
+        data["shipping_address"] = addr and {
             "street": addr.street,
             "city": addr.city,
             "state": addr.state,
@@ -147,17 +312,48 @@ def get_order(order_id):
             "country": addr.country
         }
 
+    if "history" in include:
+        data["status_history"] = _status_history_rows(
+            sorted(order.status_history, key=lambda h: (h.changed_at, h.id)))
+    if "payments" in include:
+        data["payment_history"] = _payment_rows(order.payments)
+    if "delivery" in include:
+        data["delivery_history"] = _delivery_rows(order.runner_assignments)
+
     return jsonify(data), 200
 
+def _status_history_rows(hist):
+    return [
+        {"old": h.old_status, "new": h.new_status, "at": h.changed_at.isoformat()}
+        for h in hist
+    ]
+
+def _payment_rows(payments):
+    return [
+        {"id": p.id, "method": p.payment_method, "tx": p.transaction_id,
+         "status": p.status, "paid_at": p.paid_at.isoformat() if p.paid_at else None}
+        for p in payments
+    ]
+
+def _delivery_rows(assigns):
+    return [
+        {"assign_id": a.id, "runner_id": a.runner_id, "status": a.status,
+         "assigned_at": a.assigned_at.isoformat(),
+         "picked_up_at": a.picked_up_at and a.picked_up_at.isoformat(),
+         "delivered_at": a.delivered_at and a.delivered_at.isoformat()}
+        for a in assigns
+    ]
+
 # Change order status (admin or user for specific transitions)
 @order_bp.route("/<int:order_id>/status", methods=["PUT"])
-@jwt_required()
+@role_required()
 def change_status(order_id):
-    me = get_jwt_identity()
-    user = User.query.get(me)
+    is_admin = current_role() == "admin"
     order = Order.query.get(order_id)
     if not order:
         return jsonify({"error": "Order not found"}), 404
+    if not is_admin and order.user_id != current_user_id():
+        return jsonify({"error": "Unauthorized"}), 403
 
     new = (request.get_json() or {}).get("status")
     valid = ["Pending","Processing","Out_for_delivery","Delivered",
@@ -165,56 +361,52 @@ def change_status(order_id):
     if new not in valid:
         return jsonify({"error": "Invalid status"}), 400
 
-    if user.role != "admin" and new not in ["Cancelled","Defective","Returned"]:
+    if not is_admin and new not in ["Cancelled","Defective","Returned"]:
         return jsonify({"error": "Unauthorized"}), 403
 
     old = order.status
     order.status = new
     _record_history(order, old, new)
-
-    if new == "Return_Processed":
-        for it in order.order_items:
-            p = Product.query.get(it.product_id)
-            p.stock += it.quantity
-            inv = Inventory.query.filter_by(product_id=p.id).first()
-            if inv:
-                inv.stock += it.quantity
-                inv.updated_at = datetime.utcnow()
+    set_summary_status(order.id, new)
+    publish("order.status_changed", order_id=order.id, old_status=old, new_status=new)
 
     db.session.commit()
     return jsonify({"message": f"Order status updated to '{new}'"}), 200
 
+# Side effects of status changes run after the commit, off the request
+# (app/events.py). Stock goes back on the shelf once a return is processed.
+@subscribe("order.status_changed")
+def _restock_processed_return(event):
+    if event["new_status"] != "Return_Processed":
+        return
+    returned = {}
+    for it in OrderItems.query.filter_by(order_id=event["order_id"]):
+        returned[it.product_id] = returned.get(it.product_id, 0) + it.quantity
+    if returned:
+        release_stock(returned)
+        on_commit(lambda: invalidate_catalog(list(returned), carts=False))
+
+# Admin: per-SKU checkout conflict counters
+@order_bp.route("/stock_conflicts", methods=["GET"])
+@role_required("admin")
+def stock_conflicts():
+    return jsonify(stock_metrics.snapshot()), 200
+
 # Get order history (status, optional payments/delivery)
 @order_bp.route("/<int:order_id>/history", methods=["GET"])
-@jwt_required()
+@role_required()
 def history(order_id):
-    me = get_jwt_identity()
-    user = User.query.get(me)
     order = Order.query.get(order_id)
-    if not order or (order.user_id != me and user.role != "admin"):
+    if not order or (order.user_id != current_user_id() and current_role() != "admin"):
         return jsonify({"error": "Unauthorized"}), 403
 
     include = (request.args.get("include") or "").split(",")
     out = {}
 
     hist = OrderStatusHistory.query.filter_by(order_id=order_id).order_by(OrderStatusHistory.changed_at).all()
-    out["status_history"] = [
-        {"old": h.old_status, "new": h.new_status, "at": h.changed_at.isoformat()}
-        for h in hist
-    ]
+    out["status_history"] = _status_history_rows(hist)
     if "payments" in include:
-        out["payment_history"] = [
-            {"id": p.id, "method": p.payment_method, "tx": p.transaction_id,
-             "status": p.status, "paid_at": p.paid_at.isoformat() if p.paid_at else None}
-            for p in Payments.query.filter_by(order_id=order_id)
-        ]
+        out["payment_history"] = _payment_rows(Payments.query.filter_by(order_id=order_id))
     if "delivery" in include:
-        assigns = RunnerAssignments.query.filter_by(order_id=order_id).all()
-        out["delivery_history"] = [
-            {"assign_id": a.id, "runner_id": a.runner_id, "status": a.status,
-             "assigned_at": a.assigned_at.isoformat(),
-             "picked_up_at": a.picked_up_at and a.picked_up_at.isoformat(),
-             "delivered_at": a.delivered_at and a.delivered_at.isoformat()}
-            for a in assigns
-        ]
+        out["delivery_history"] = _delivery_rows(RunnerAssignments.query.filter_by(order_id=order_id))
     return jsonify(out), 200
\ No newline at end of file
@@ -0,0 +1,119 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import exists, func, insert, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import db, Order, OrderItems, OrderSummary, Product
+
+# Per-user order summaries (OrderSummary) behind GET /orders/userorder.
+# Callers write them inside the transaction that changes the order, so the
+# projection never lags the orders table; rebuild_order_summaries() repairs
+# or backfills it in place.
+
+PREVIEW_NAMES = 3
+PREVIEW_LENGTH = 255
+
+
+def _preview(names):
+    if not names:
+        return None
+    text = ", ".join(names[:PREVIEW_NAMES])
+    if len(names) > PREVIEW_NAMES:
+        text += f" +{len(names) - PREVIEW_NAMES} more"
+    return text[:PREVIEW_LENGTH]
+
+
+def add_order_summary(order, item_names, item_count):
+    db.session.execute(insert(OrderSummary).values(
+        order_id=order.id,
+        user_id=order.user_id,
+        created_at=order.created_at,
+        status=order.status,
+        total_price=order.total_price,
+        item_count=item_count,
+        preview=_preview(item_names),
+    ))
+
+
+def set_summary_status(order_id, status):
+    db.session.execute(
+        update(OrderSummary).where(OrderSummary.order_id == order_id).values(status=status))
+
+
+_SUMMARY_COLUMNS = ("user_id", "created_at", "status", "total_price", "item_count", "preview")
+
+
+def _upsert_summaries(batch):
+    table = OrderSummary.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.order_id],
+            set_={c: getattr(stmt.excluded, c) for c in _SUMMARY_COLUMNS})
+    elif dialect == "mysql":
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(**{c: getattr(stmt.inserted, c) for c in _SUMMARY_COLUMNS})
+    else:
+        for row in batch:
+            db.session.merge(OrderSummary(**row))
+        return
+    db.session.execute(stmt, batch)
+
+
+def rebuild_order_summaries(user_id=None, batch_size=1000):
+    # Rewrites the summary rows of every order (or one user's orders) in
+    # place, one committed batch at a time, then drops summaries whose order
+    # is gone. Nothing is deleted up front, so readers never see a partial
+    # history and orders placed meanwhile keep their own rows. Returns the
+    # number of rows written.
+    orders = db.session.query(Order.id).order_by(Order.id)
+    orphans = OrderSummary.query.filter(~exists().where(Order.id == OrderSummary.order_id))
+    if user_id is not None:
+        orders = orders.filter(Order.user_id == user_id)
+        orphans = orphans.filter(OrderSummary.user_id == user_id)
+
+    written = 0
+    last_id = 0
+    while True:
+        ids = [row.id for row in orders.filter(Order.id > last_id).limit(batch_size)]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        names, counts = {}, {}
+        rows = (db.session.query(OrderItems.order_id, OrderItems.quantity, Product.name)
+                .join(Product, Product.id == OrderItems.product_id)
+                .filter(OrderItems.order_id.in_(ids))
+                .order_by(OrderItems.order_id, OrderItems.id))
+        for row in rows:
+            names.setdefault(row.order_id, []).append(row.name)
+            counts[row.order_id] = counts.get(row.order_id, 0) + row.quantity
+
+        batch = [{
+            "order_id": o.id,
+            "user_id": o.user_id,
+            "created_at": o.created_at,
+            "status": o.status or "Pending",
+            "total_price": o.total_price,
+            "item_count": counts.get(o.id, 0),
+            "preview": _preview(names.get(o.id, [])),
+        } for o in Order.query.filter(Order.id.in_(ids))]
+        _upsert_summaries(batch)
+        db.session.commit()
+        written += len(batch)
+    orphans.delete(synchronize_session=False)
+    db.session.commit()
+    return written
+
+
+orders_cli = AppGroup("orders", help="Order maintenance")
+
+
+@orders_cli.command("rebuild-summaries")
+@click.option("--user-id", type=int, default=None, help="Only this customer's orders.")
+def rebuild_summaries_command(user_id):
+    count = rebuild_order_summaries(user_id=user_id)
+    total = db.session.query(func.count(OrderSummary.order_id)).scalar()
+    click.echo(f"rebuilt {count} order summaries ({total} in table)")
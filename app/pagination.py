@@ -0,0 +1,61 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+# Shared helpers for keyset ("cursor") pagination and list filters.
+# A cursor is an opaque, url-safe token that wraps the sort key of the last
+# row a client has already seen, so the next page is a plain range scan
+# instead of an OFFSET that gets slower the deeper the client pages.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(raw, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    if raw in (None, ""):
+        return default
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+
+def wants_page(args, *names):
+    # Old clients never send paging arguments; only switch the response shape
+    # when at least one of them is present.
+    return any(name in args for name in names or ("limit", "cursor"))
+
+
+def parse_date_range(args, start="from", end="to"):
+    # ?from=2025-01-01&to=2025-01-31 (dates are inclusive whole days) or full
+    # ISO timestamps. Returns (start, end_exclusive); either may be None.
+    def parse(name, is_end):
+        raw = args.get(name)
+        if not raw:
+            return None
+        try:
+            if len(raw) == 10:
+                value = datetime.strptime(raw, "%Y-%m-%d")
+                return value + timedelta(days=1) if is_end else value
+            return datetime.fromisoformat(raw)
+        except ValueError:
+            raise ValueError(f"{name} must be YYYY-MM-DD or an ISO timestamp")
+    return parse(start, False), parse(end, True)
@@ -0,0 +1,130 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import app
+
+logger = logging.getLogger(__name__)
+
+# Password hashing policy and the process pool it runs on.
+#
+# PASSWORD_HASH_METHOD is a werkzeug method string ("scrypt:32768:8:1",
+# "pbkdf2:sha256:600000", ...). Hashes and checks run in a pool of
+# PASSWORD_HASH_WORKERS processes, so a burst of logins queues there
+# instead of occupying every request thread; at most PASSWORD_HASH_QUEUE
+# jobs wait at a time and a caller that cannot get a slot within
+# PASSWORD_HASH_TIMEOUT seconds gets HashingBusy (the routes answer 503).
+# PASSWORD_HASH_WORKERS = 0 hashes on the calling thread.
+#
+# A stored hash made with other parameters still verifies; verify() then
+# also returns a new hash under the current policy for the caller to save.
+
+
+class HashingBusy(Exception):
+    pass
+
+
+@app.errorhandler(HashingBusy)
+def _hashing_busy(e):
+    return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
+
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+_current_prefix = None
+
+
+def _method():
+    return app.config.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+
+
+def _salt_length():
+    return app.config.get("PASSWORD_SALT_LENGTH", 16)
+
+
+def _get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            workers = app.config.get("PASSWORD_HASH_WORKERS", 2)
+            # spawn: forking a process that already runs request threads can
+            # copy a held lock into the child
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _slots = threading.BoundedSemaphore(workers + app.config.get("PASSWORD_HASH_QUEUE", 64))
+        return _pool, _slots
+
+
+def _broken(pool):
+    # a worker died (OOM kill); start a fresh pool for the next caller
+    global _pool
+    logger.exception("password hashing pool broke, restarting it")
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    return HashingBusy("password hashing pool restarted")
+
+
+def _run(fn, *args):
+    if not app.config.get("PASSWORD_HASH_WORKERS", 2):
+        return fn(*args)
+    pool, slots = _get_pool()
+    timeout = app.config.get("PASSWORD_HASH_TIMEOUT", 5.0)
+    if not slots.acquire(timeout=timeout):
+        raise HashingBusy("password hashing queue is full")
+    try:
+        future = pool.submit(fn, *args)
+    except BaseException as e:
+        slots.release()
+        if isinstance(e, BrokenProcessPool):
+            raise _broken(pool)
+        raise
+    # the slot is held until the job leaves the pool, not until the caller
+    # stops waiting, so timed-out jobs still count against the queue
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except BrokenProcessPool:
+        raise _broken(pool)
+    except FutureTimeout:
+        future.cancel()  # drops it if still queued; a running job finishes
+        raise HashingBusy("password hashing timed out")
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, _method(), _salt_length())
+
+
+def _policy_prefix():
+    # "scrypt:32768:8:1" / "pbkdf2:sha256:600000": the method exactly as
+    # werkzeug writes it, defaults filled in
+    global _current_prefix
+    if _current_prefix is None or _current_prefix[0] != _method():
+        _current_prefix = (_method(), generate_password_hash("", _method(), 1).split("$", 1)[0])
+    return _current_prefix[1]
+
+
+def needs_rehash(stored):
+    method, _, rest = stored.partition("$")
+    salt = rest.partition("$")[0]
+    return method != _policy_prefix() or len(salt) < _salt_length()
+
+
+def check_password(stored, password):
+    return bool(stored) and _run(check_password_hash, stored, password)
+
+
+def verify_password(stored, password):
+    # -> (matches, new hash to store or None); for login
+    if not check_password(stored, password):
+        return False, None
+    if needs_rehash(stored):
+        return True, hash_password(password)
+    return True, None
+
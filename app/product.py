@@ -1,9 +1,20 @@
 from flask import Blueprint, request, jsonify,send_from_directory
 from app.models import db, Product
+import mimetypes
 import os
 from werkzeug.utils import secure_filename
 from app import app, db
-from flask_jwt_extended import jwt_required
+from app.catalog import (
+    catalog_etag, get_catalog_ids, get_product_dict,
+    get_product_dicts, invalidate_catalog, parse_fields, project
+)
+from app.pagination import decode_cursor, encode_cursor, parse_limit, wants_page
+from app.authz import role_required
+from app.cache import cache_stats
+from app.images import HASHED_NAME, InvalidImage, queue_variants, save_upload
+from bisect import bisect_right
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from app.views import track_view, view_tracker
 
 
 product_bp = Blueprint('product', __name__,url_prefix='/api')
@@ -14,19 +25,73 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 
 
+def _not_modified(etag):
+    resp = app.response_class(status=304)
+    resp.set_etag(etag)
+    return resp
+
+
 # Get all products
+# Without paging arguments the full list is returned (old clients).
+# ?limit=&cursor=&fields=&category= switches to keyset pages ordered by id:
+#   {"products": [...], "next_cursor": "..." | null}
+# Both modes send a strong ETag; a matching If-None-Match gets a 304 before
+# the cache or the database is touched.
 @product_bp.route('/get_all_products', methods=['GET'])
 def get_products():
-    products = Product.query.all()
-    return jsonify([product.to_dict() for product in products]), 200
+    paged = wants_page(request.args, 'limit', 'cursor', 'fields')
+    etag = catalog_etag('products', paged, sorted(request.args.items(multi=True)))
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    if not paged:
+        resp = jsonify(get_product_dicts(get_catalog_ids()))
+        resp.set_etag(etag)
+        return resp, 200
+
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        limit = parse_limit(request.args.get('limit'))
+        cursor = decode_cursor(request.args.get('cursor'))
+        after_id = int(cursor["id"]) if cursor else 0
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({"error": str(e) or "Invalid cursor"}), 400
+
+    # The cached id index is sorted, so the keyset seek is a bisect; one
+    # extra id tells us whether another page exists.
+    ids = get_catalog_ids(request.args.get('category'))
+    start = bisect_right(ids, after_id)
+    page_ids = ids[start:start + limit]
+    has_more = start + limit < len(ids)
+    next_cursor = encode_cursor({"id": page_ids[-1]}) if has_more and page_ids else None
+
+    resp = jsonify({
+        "products": [project(p, fields) for p in get_product_dicts(page_ids)],
+        "next_cursor": next_cursor,
+    })
+    resp.set_etag(etag)
+    return resp, 200
 
 # Get a single product by ID
 @product_bp.route('/get_product/<int:id>', methods=['GET'])
 def get_product(id):
-    product = Product.query.get(id)
+    product = get_product_dict(id)
     if not product:
         return jsonify({"error": "Product not found"}), 404
-    return jsonify(product.to_dict()), 200
+    track_view(id, _optional_user_id())
+    return jsonify(product), 200
+
+def _optional_user_id():
+    # The endpoint is public; a signed-in viewer is recorded when a valid
+    # token is sent, an anonymous view otherwise.
+    if 'Authorization' not in request.headers:
+        return None
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return None
+    return int(identity) if identity else None
 
 # Get products based on category
 @product_bp.route('/category/filter', methods=['GET'])
@@ -34,15 +99,26 @@ def filter_products_by_category():
     category = request.args.get('category')
     if not category:
         return jsonify({"message": "Please provide a category to filter"}), 400
-    products = Product.query.filter_by(category=category).all()
-    return jsonify([product.to_dict() for product in products]), 200
+    return jsonify(get_product_dicts(get_catalog_ids(category))), 200
+
+# Cache hit/miss counters (catalog, meta, runners, ...)
+@product_bp.route('/catalog/cache_stats', methods=['GET'])
+@role_required("admin")
+def catalog_cache_stats():
+    return jsonify(cache_stats()), 200
+
+# Product view tracker queue and drop counters
+@product_bp.route('/catalog/view_stats', methods=['GET'])
+@role_required("admin")
+def catalog_view_stats():
+    return jsonify(view_tracker.stats()), 200
 
 FIXED_CATEGORIES = ["Fruits", "Vegetables", "Dairy"]
 
 
 #Add a product (Admin Only)
 @product_bp.route('/add_product', methods=['POST'])
-@jwt_required()
+@role_required("admin")
 def add_product():
     # Multipart form-data support
     name = request.form.get('name')
@@ -62,13 +138,13 @@ def add_product():
     except ValueError:
         return jsonify({"error": "Invalid price or stock"}), 400
 
-    # Save image
+    # Save image (content-hashed name; variants are rendered after commit)
     image_url = ""
     if image_file:
-        filename = secure_filename(image_file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        image_file.save(filepath)
-        image_url = f"/api/img/{filename}"  # Save as API route path
+        try:
+            image_url = save_upload(image_file)
+        except InvalidImage as e:
+            return jsonify({"error": str(e)}), 400
 
     # Save to DB
     new_product = Product(
@@ -82,7 +158,9 @@ def add_product():
     )
 
     db.session.add(new_product)
+    queue_variants(new_product)
     db.session.commit()
+    invalidate_catalog()
 
     return jsonify({
         "message": "Product added successfully",
@@ -91,12 +169,19 @@ def add_product():
 
 from flask import send_file, current_app
 
+# Content-hashed files (uploads and their variants) never change, so they
+# may be cached for a year; older names are revalidated by ETag.
 @product_bp.route('/img/<filename>', methods=['GET'])
 def serve_image(filename):
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], secure_filename(filename))
+    if not os.path.isfile(file_path):
         return jsonify({"error": "File not found"}), 404
-    return send_file(file_path, mimetype='image/png')
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if HASHED_NAME.match(filename):
+        resp = send_file(file_path, mimetype=mimetype, max_age=31536000)
+        resp.cache_control.immutable = True
+        return resp
+    return send_file(file_path, mimetype=mimetype, max_age=0)
 
 # @product_bp.route('/img/<filename>', methods=['GET'])
 # def serve_image(filename):
@@ -105,7 +190,7 @@ def serve_image(filename):
 
 # Update a product (Admin Only)
 @product_bp.route('/update_product/<int:id>', methods=['PUT'])
-@jwt_required()
+@role_required("admin")
 def update_product(id):
     product = Product.query.get(id)
     if not product:
@@ -136,12 +221,17 @@ def update_product(id):
 
     # Handle image upload (if any)
     if image_file:
-        filename = secure_filename(image_file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        image_file.save(filepath)
-        product.image_url = f"/api/img/{filename}"  # Update image URL path
+        try:
+            image_url = save_upload(image_file)
+        except InvalidImage as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
+        if image_url != product.image_url:
+            product.image_url = image_url
+            queue_variants(product)
 
     db.session.commit()
+    invalidate_catalog()
     return jsonify({
         "message": "Product updated successfully",
         "product": product.to_dict()
@@ -150,7 +240,7 @@ def update_product(id):
 
 # Delete a product (Admin Only)
 @product_bp.route('/delete_product/<int:id>', methods=['DELETE'])
-@jwt_required()     
+@role_required("admin")
 def delete_product(id):
     product = Product.query.get(id)
     if not product:
@@ -158,5 +248,6 @@ def delete_product(id):
 
     db.session.delete(product)
     db.session.commit()
+    invalidate_catalog()
     return jsonify({"message": "Product deleted successfully"}), 200
 
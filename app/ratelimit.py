@@ -0,0 +1,190 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+from app import app
+from app.cache import RedisClient, RedisError
+
+logger = logging.getLogger(__name__)
+
+# Rate limiting for expensive unauthenticated endpoints (login, register).
+#
+# Limits are configured per blueprint in RATE_LIMITS and applied to the
+# views decorated with @rate_limited. Each blueprint can set three scopes:
+#   ip       token bucket per client address: absorbs a burst, then allows
+#            a steady rate
+#   account  sliding-window counter per email in the request body, which
+#            caps guesses against one account from any number of addresses
+#   global   token bucket for the blueprint as a whole, so a flood cannot
+#            take all of the password hashing capacity
+# Specs read "<count>/<period>", e.g. "20/minute" or "10/15minutes".
+#
+# RATE_LIMIT_BACKEND "local" keeps state per process; "redis" shares it
+# between workers over CACHE_REDIS_URL. The shared backend has no
+# server-side script, so a token bucket there is enforced as a sliding
+# window with the same rate and burst. If the shared store is unreachable
+# requests are let through and counted as backend errors.
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(spec):
+    # "20/minute" -> (20, 60); "10/15minutes" -> (10, 900)
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*", spec or "")
+    if not match:
+        raise ValueError(f"Invalid rate limit {spec!r}")
+    return int(match.group(1)), int(match.group(2) or 1) * _UNITS[match.group(3)]
+
+
+def _window_wait(current, previous, limit, window, now):
+    # Seconds until current + previous * (remaining share of the previous
+    # window) drops below limit.
+    into = now % window
+    if current >= limit or not previous:
+        return window - into
+    return max((1 - (limit - current) / previous) * window - into, 0.001)
+
+
+class LocalBackend:
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _put(self, store, key, value):
+        # An evicted bucket or window reads as empty, which only errs
+        # towards letting a request through.
+        store[key] = value
+        store.move_to_end(key)
+        if len(store) > self.maxsize:
+            store.popitem(last=False)
+
+    def take(self, key, capacity, period):
+        rate = capacity / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            self._put(self._buckets, key, (tokens - 1 if not wait else tokens, now))
+        return wait
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        index = int(now // window)
+        with self._lock:
+            seen, current, previous = self._windows.get(key, (index, 0, 0))
+            if seen != index:
+                current, previous = 0, current if seen == index - 1 else 0
+            if current + previous * (1 - (now % window) / window) >= limit:
+                self._put(self._windows, key, (index, current, previous))
+                return _window_wait(current, previous, limit, window, now)
+            self._put(self._windows, key, (index, current + 1, previous))
+        return 0
+
+
+class RedisBackend:
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = f"{prefix}:ratelimit:"
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        index = int(now // window)
+        current_key = f"{self.prefix}{key}:{index}"
+        current, _, previous = self.client.pipeline([
+            ("INCR", current_key),
+            ("EXPIRE", current_key, window * 2 + 1),
+            ("GET", f"{self.prefix}{key}:{index - 1}"),
+        ])
+        previous = int(previous or 0)
+        if (current - 1) + previous * (1 - (now % window) / window) >= limit:
+            # a rejected attempt must not extend the lockout
+            self.client.execute("INCRBY", current_key, -1)
+            return _window_wait(current - 1, previous, limit, window, now)
+        return 0
+
+    def take(self, key, capacity, period):
+        return self.hit(key, capacity, period)
+
+
+class RateLimiter:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.allowed = {}
+        self.rejected = {}
+        self.backend_errors = 0
+
+    def _count(self, counter, name):
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+
+    def check(self, group, ip=None, account=None):
+        # -> seconds the caller should wait, 0 when the request may proceed
+        limits = app.config.get("RATE_LIMITS", {}).get(group) or {}
+        checks = []
+        if limits.get("ip") and ip:
+            checks.append(("ip", self.backend.take, f"{group}:ip:{ip}", limits["ip"]))
+        if limits.get("account") and account:
+            checks.append(("account", self.backend.hit, f"{group}:account:{account}", limits["account"]))
+        if limits.get("global"):
+            checks.append(("global", self.backend.take, f"{group}:global", limits["global"]))
+        for scope, fn, key, spec in checks:
+            try:
+                wait = fn(key, *parse_rate(spec))
+            except (OSError, ConnectionError, RedisError):
+                logger.exception("rate limit backend failed, letting request through")
+                with self._lock:
+                    self.backend_errors += 1
+                return 0
+            if wait:
+                self._count(self.rejected, f"{group}.{scope}")
+                return wait
+        self._count(self.allowed, group)
+        return 0
+
+    def stats(self):
+        with self._lock:
+            return {"backend": app.config.get("RATE_LIMIT_BACKEND", "local"),
+                    "allowed": dict(self.allowed), "rejected": dict(self.rejected),
+                    "backend_errors": self.backend_errors}
+
+
+def _build_backend():
+    backend = app.config.get("RATE_LIMIT_BACKEND", "local")
+    if backend == "local":
+        return LocalBackend(maxsize=app.config.get("RATE_LIMIT_LOCAL_SIZE", 100000))
+    if backend == "redis":
+        return RedisBackend(RedisClient(app.config["CACHE_REDIS_URL"]),
+                            prefix=app.config.get("CACHE_KEY_PREFIX", "grocery"))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend!r}")
+
+
+limiter = RateLimiter(_build_backend())
+
+
+def rate_limited(fn):
+    # Applies the RATE_LIMITS entry of the view's blueprint. Client address
+    # is request.remote_addr; behind a proxy wrap the app in ProxyFix.
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if app.config.get("RATE_LIMIT_ENABLED", True) and request.method != "OPTIONS":
+            email = (request.get_json(silent=True) or {}).get("email")
+            account = email.strip().lower() if isinstance(email, str) and email.strip() else None
+            wait = limiter.check(request.blueprint, ip=request.remote_addr, account=account)
+            if wait:
+                return (jsonify({"error": "Too many requests, please try again later"}), 429,
+                        {"Retry-After": str(math.ceil(wait))})
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,222 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import app
+from app.models import (
+    db, Order, OrderItems, OrderStatusHistory, ProductSales, ProductSalesBackfill, RollupState
+)
+
+logger = logging.getLogger(__name__)
+
+# Incremental ProductSales rollup.
+#
+# Two append-only streams are folded into per-product, per-day rows:
+#   sales    OrderItems, dated by the order's created_at
+#   returns  OrderStatusHistory rows moving an order to Return_Processed
+#            (the point where stock goes back on the shelf), subtracted on
+#            the day of the return
+# Each stream keeps a high-water mark (last processed id) in RollupState.
+# A chunk's upserts and its new mark commit together, so a crash never
+# double-counts or skips a row. Rows younger than SALES_ROLLUP_LAG_SECONDS
+# are left for the next run: an id handed out to a checkout that has not
+# committed yet must not be jumped over.
+#
+# A backfill folds both streams from the start into ProductSalesBackfill
+# under marks of its own (<stream>.backfill), so an interrupted backfill
+# resumes where it stopped, then swaps the result into ProductSales and
+# moves the live marks to where it got, all in one transaction. Until the
+# swap /admin/sales keeps reading the previous, complete rollup.
+
+SALES_STREAM = "product_sales.items"
+RETURNS_STREAM = "product_sales.returns"
+BACKFILL_SUFFIX = ".backfill"
+_ROLLUP_COLUMNS = ("product_id", "recorded_on", "quantity_sold", "total_revenue")
+
+
+def _sales_chunk(after_id, limit, cutoff):
+    rows = (db.session.query(OrderItems.id, OrderItems.product_id, OrderItems.quantity,
+                             OrderItems.price_at_order_time, Order.created_at)
+            .join(Order, Order.id == OrderItems.order_id)
+            .filter(OrderItems.id > after_id)
+            .order_by(OrderItems.id)
+            .limit(limit)
+            .all())
+    deltas = {}
+    last_id = after_id
+    kept = 0
+    for row in rows:
+        if row.created_at > cutoff:
+            break
+        key = (row.product_id, row.created_at.date())
+        qty, revenue = deltas.get(key, (0, 0.0))
+        deltas[key] = (qty + row.quantity, revenue + row.quantity * row.price_at_order_time)
+        last_id = row.id
+        kept += 1
+    return deltas, last_id, kept, kept == limit
+
+
+def _returns_chunk(after_id, limit, cutoff):
+    events = (OrderStatusHistory.query
+              .filter(OrderStatusHistory.id > after_id,
+                      OrderStatusHistory.new_status == "Return_Processed")
+              .order_by(OrderStatusHistory.id)
+              .limit(limit)
+              .all())
+    kept = []
+    for event in events:
+        if event.changed_at > cutoff:
+            break
+        kept.append(event)
+
+    items = {}
+    if kept:
+        for item in OrderItems.query.filter(OrderItems.order_id.in_({e.order_id for e in kept})):
+            items.setdefault(item.order_id, []).append(item)
+
+    deltas = {}
+    for event in kept:
+        for item in items.get(event.order_id, []):
+            key = (item.product_id, event.changed_at.date())
+            qty, revenue = deltas.get(key, (0, 0.0))
+            deltas[key] = (qty - item.quantity, revenue - item.quantity * item.price_at_order_time)
+    last_id = kept[-1].id if kept else after_id
+    return deltas, last_id, len(kept), len(kept) == limit
+
+
+def apply_sales_deltas(deltas, model=ProductSales):
+    # Adds (quantity, revenue) to each (product_id, day) row of model
+    # (ProductSales or its backfill copy), creating it if needed; one
+    # statement on SQLite and MySQL.
+    if not deltas:
+        return
+    rows = [{"product_id": pid, "recorded_on": day, "quantity_sold": qty, "total_revenue": revenue}
+            for (pid, day), (qty, revenue) in deltas.items()]
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.recorded_on],
+            set_={"quantity_sold": table.c.quantity_sold + stmt.excluded.quantity_sold,
+                  "total_revenue": table.c.total_revenue + stmt.excluded.total_revenue})
+    elif dialect == "mysql":
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            quantity_sold=table.c.quantity_sold + stmt.inserted.quantity_sold,
+            total_revenue=table.c.total_revenue + stmt.inserted.total_revenue)
+    else:
+        for row in rows:
+            existing = model.query.filter_by(
+                product_id=row["product_id"], recorded_on=row["recorded_on"]).with_for_update().first()
+            if existing:
+                existing.quantity_sold += row["quantity_sold"]
+                existing.total_revenue += row["total_revenue"]
+            else:
+                db.session.add(model(**row))
+        return
+    db.session.execute(stmt, rows)
+
+
+def rollup_mark(name):
+    # Locks a stream's mark row so two concurrent runs cannot fold the
+    # same chunk twice.
+    state = db.session.get(RollupState, name, with_for_update=True)
+    if state is None:
+        state = RollupState(name=name, last_id=0)
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+
+def _fold_stream(name, fetch, chunk_size, cutoff, model=ProductSales):
+    processed = 0
+    while True:
+        state = rollup_mark(name)
+        deltas, last_id, count, more = fetch(state.last_id, chunk_size, cutoff)
+        if count:
+            apply_sales_deltas(deltas, model)
+            state.last_id = last_id
+            state.updated_at = datetime.utcnow()
+        db.session.commit()
+        processed += count
+        if not more:
+            return processed
+
+
+def run_rollup(chunk_size=None, lag_seconds=None, backfill=False):
+    chunk_size = chunk_size or app.config.get("SALES_ROLLUP_CHUNK_SIZE", 5000)
+    if lag_seconds is None:
+        lag_seconds = app.config.get("SALES_ROLLUP_LAG_SECONDS", 60)
+    cutoff = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    suffix, model = (BACKFILL_SUFFIX, ProductSalesBackfill) if backfill else ("", ProductSales)
+    began = time.perf_counter()
+    sales = _fold_stream(SALES_STREAM + suffix, _sales_chunk, chunk_size, cutoff, model)
+    returns = _fold_stream(RETURNS_STREAM + suffix, _returns_chunk, chunk_size, cutoff, model)
+    if backfill:
+        _swap_backfill()
+    return {"order_items": sales, "returns": returns,
+            "elapsed_ms": round((time.perf_counter() - began) * 1000, 1)}
+
+
+def _swap_backfill():
+    # Replaces ProductSales with the backfill copy and moves the live marks
+    # to the backfill's. Rows a concurrent incremental run folded past those
+    # marks are dropped with the old table and folded again on its next run.
+    live = {name: rollup_mark(name) for name in (SALES_STREAM, RETURNS_STREAM)}
+    staged = {name: rollup_mark(name + BACKFILL_SUFFIX) for name in live}
+    ProductSales.query.delete(synchronize_session=False)
+    source = ProductSalesBackfill.__table__
+    db.session.execute(insert(ProductSales).from_select(
+        list(_ROLLUP_COLUMNS), select(*[source.c[name] for name in _ROLLUP_COLUMNS])))
+    now = datetime.utcnow()
+    for name, state in live.items():
+        state.last_id = staged[name].last_id
+        state.updated_at = now
+    ProductSalesBackfill.query.delete(synchronize_session=False)
+    RollupState.query.filter(RollupState.name.in_([name + BACKFILL_SUFFIX for name in live])) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+
+def rollup_marks():
+    # Live marks, plus <stream>.backfill marks while a backfill is running.
+    names = [SALES_STREAM, RETURNS_STREAM]
+    states = RollupState.query.filter(RollupState.name.in_(names + [n + BACKFILL_SUFFIX for n in names])).all()
+    return {s.name: {"last_id": s.last_id, "updated_at": s.updated_at.isoformat() if s.updated_at else None}
+            for s in states}
+
+
+sales_cli = AppGroup("sales", help="ProductSales rollup")
+
+
+@sales_cli.command("rollup")
+@click.option("--backfill", is_flag=True,
+              help="Rebuild ProductSales from all historical orders (resumes an interrupted backfill).")
+@click.option("--chunk-size", type=int, default=None, help="Rows folded per transaction.")
+@click.option("--interval", type=float, default=0, help="Repeat every N seconds (0 = run once).")
+def rollup_command(backfill, chunk_size, interval):
+    if backfill:
+        click.echo("folding all order items into a new rollup; ProductSales is replaced when done")
+    while True:
+        try:
+            stats = run_rollup(chunk_size=chunk_size, backfill=backfill)
+            backfill = False
+            click.echo(f"{datetime.utcnow().isoformat()} order_items={stats['order_items']} "
+                       f"returns={stats['returns']} in {stats['elapsed_ms']}ms")
+        except Exception:
+            db.session.rollback()
+            logger.exception("sales rollup failed")
+            if not interval:
+                raise
+        finally:
+            db.session.remove()
+        if not interval:
+            break
+        time.sleep(interval)
@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import case, update
+
+from app import app
+from app.models import db, Product, Inventory
+
+# Stock moves for checkout and returns.
+#
+# Checkout reserves stock optimistically: no row is locked up front; instead
+# one conditional UPDATE decrements every line only where enough stock is
+# left. If fewer rows match than there are lines, somebody else won the race
+# for at least one SKU and the caller retries (bounded, with jittered
+# back-off) on a fresh read.
+
+
+class StockConflict(Exception):
+
+    def __init__(self, product_ids):
+        super().__init__(f"Stock changed concurrently for {sorted(product_ids)}")
+        self.product_ids = product_ids
+
+
+# MySQL ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT
+_LOCK_ERROR_CODES = (1213, 1205)
+
+
+def is_lock_conflict(error):
+    # True for an OperationalError that a retry can clear: a deadlock or lock
+    # wait timeout on MySQL, "database is locked" on SQLite.
+    orig = getattr(error, "orig", None)
+    args = getattr(orig, "args", None) or ()
+    if args and args[0] in _LOCK_ERROR_CODES:
+        return True
+    return "database is locked" in str(orig)
+
+
+class StockMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.conflicts = Counter()       # product_id -> lost races
+        self.lock_errors = 0             # deadlocks / "database is locked"
+        self.retries = 0
+        self.exhausted = 0               # checkouts that gave up after all attempts
+
+    def conflict(self, product_ids):
+        with self._lock:
+            self.conflicts.update(product_ids)
+
+    def add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self, top=20):
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "exhausted": self.exhausted,
+                "lock_errors": self.lock_errors,
+                "conflicts_total": sum(self.conflicts.values()),
+                "conflicts_by_product": [
+                    {"product_id": pid, "conflicts": n}
+                    for pid, n in self.conflicts.most_common(top)
+                ],
+            }
+
+
+stock_metrics = StockMetrics()
+
+
+def _qty_case(quantities, column):
+    return case(quantities, value=column)
+
+
+def reserve_stock(quantities):
+    # Decrement {product_id: qty} only where stock >= qty, in one statement.
+    # Raises StockConflict with the ids that could not be reserved; the
+    # caller must roll back.
+    ids = list(quantities)
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(ids))
+        .where(Product.stock >= _qty_case(quantities, Product.id))
+        .values(stock=Product.stock - _qty_case(quantities, Product.id))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(ids):
+        short = {row.id for row in db.session.query(Product.id, Product.stock)
+                 .filter(Product.id.in_(ids))
+                 if row.stock < quantities[row.id]}
+        raise StockConflict(short or set(ids))
+    _move_inventory(quantities, -1)
+
+
+def release_stock(quantities):
+    # Returns are never contended on the "enough stock" condition.
+    ids = list(quantities)
+    db.session.execute(
+        update(Product)
+        .where(Product.id.in_(ids))
+        .values(stock=Product.stock + _qty_case(quantities, Product.id))
+        .execution_options(synchronize_session=False)
+    )
+    _move_inventory(quantities, +1)
+
+
+def _move_inventory(quantities, sign):
+    db.session.execute(
+        update(Inventory)
+        .where(Inventory.product_id.in_(list(quantities)))
+        .values(stock=Inventory.stock + sign * _qty_case(quantities, Inventory.product_id),
+                updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def backoff(attempt):
+    # Full jitter: spread retries of colliding checkouts apart.
+    base = app.config.get("STOCK_RETRY_BACKOFF_MS", 10) / 1000.0
+    time.sleep(random.uniform(0, base * (2 ** attempt)))
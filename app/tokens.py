@@ -0,0 +1,181 @@
+import logging
+import time
+import uuid
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from app import app, jwt
+from app.authz import user_claims
+from app.cache import get_cache
+from app.models import db, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# Token store for the access/refresh flow.
+#
+# Access tokens are short-lived (JWT_ACCESS_TOKEN_EXPIRES); clients renew
+# them at /auth/refresh with a refresh token instead of the password. Both
+# tokens of a login carry the same session id ("sid"). Revocations are rows
+# of RevokedToken, so every worker sees them and they survive restarts:
+#   jti:<jti>          one token (logout)
+#   sid:<sid>          a whole login session (logout, refresh token reuse)
+#   user:<id>          every token of a user issued before revoked_at
+#                      (password change), compared to the microsecond
+# Refresh tokens rotate: each one can be exchanged once (used:<jti>, a
+# unique insert). Presenting a used one means it was copied, so its session
+# is revoked. A row expires when the tokens it covers would have expired
+# anyway; revocations purge expired rows every TOKEN_PURGE_SECONDS, and
+# `flask tokens purge` does the same on demand.
+#
+# Requests read the rows through the "tokens" cache: every key looked up is
+# kept for TOKEN_CHECK_TTL seconds, revoked_at if a row exists, 0 if not,
+# so a signed-in request costs no query while its keys are cached. A
+# revocation deletes its key from the cache after the commit; with
+# CACHE_BACKEND=redis that reaches every worker at once, with the local
+# backend other workers see it within TOKEN_CHECK_TTL seconds.
+
+revocation_cache = get_cache("tokens", maxsize=app.config.get("TOKEN_CACHE_SIZE", 100000),
+                             ttl=app.config.get("TOKEN_CHECK_TTL", 5))
+_last_purge = 0.0
+
+
+def _refresh_lifetime():
+    return app.config["JWT_REFRESH_TOKEN_EXPIRES"]
+
+
+def _expiry(payload):
+    return datetime.utcfromtimestamp(payload["exp"])
+
+
+def issue_tokens(user, sid=None):
+    # "issued_at" is the issue time to the microsecond; "iat" is whole
+    # seconds and cannot order a token against a revocation in its second.
+    sid = sid or uuid.uuid4().hex
+    issued = {"sid": sid, "issued_at": time.time()}
+    claims = dict(user_claims(user), **issued)
+    return {
+        "access_token": create_access_token(identity=str(user.id), additional_claims=claims),
+        "refresh_token": create_refresh_token(identity=str(user.id), additional_claims=issued),
+        "expires_in": int(app.config["JWT_ACCESS_TOKEN_EXPIRES"].total_seconds()),
+    }
+
+
+@jwt.token_in_blocklist_loader
+def _is_revoked(jwt_header, payload):
+    keys = [f"jti:{payload['jti']}", f"user:{payload['sub']}"]
+    if payload.get("sid"):
+        keys.append(f"sid:{payload['sid']}")
+    found = _revocations(keys)
+    if found[keys[0]] or (len(keys) > 2 and found[keys[2]]):
+        return True
+    revoked_before = found[keys[1]]
+    # tokens without issued_at fall back to iat, rounded down: one issued in
+    # the second of a revocation counts as older
+    return bool(revoked_before) and payload.get("issued_at", payload.get("iat", 0)) < revoked_before
+
+
+def _revocations(keys):
+    # -> {key: revoked_at, or 0 if not revoked}
+    found = revocation_cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        generation = revocation_cache.generation
+        rows = dict(db.session.query(RevokedToken.key, RevokedToken.revoked_at)
+                    .filter(RevokedToken.key.in_(missing)).all())
+        for key in missing:
+            found[key] = rows.get(key, 0)
+            revocation_cache.set(key, found[key], generation=generation)
+    return found
+
+
+def _revoke(key, expires_at):
+    # Inserts or refreshes one revocation and commits it.
+    row = {"key": key, "revoked_at": time.time(), "expires_at": expires_at}
+    table = RevokedToken.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={"revoked_at": stmt.excluded.revoked_at, "expires_at": stmt.excluded.expires_at})
+        db.session.execute(stmt, [row])
+    elif dialect == "mysql":
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(revoked_at=stmt.inserted.revoked_at,
+                                            expires_at=stmt.inserted.expires_at)
+        db.session.execute(stmt, [row])
+    else:
+        db.session.merge(RevokedToken(**row))
+    db.session.commit()
+    revocation_cache.delete(key)
+    _maybe_purge()
+
+
+def revoke_token(payload):
+    _revoke(f"jti:{payload['jti']}", _expiry(payload))
+
+
+def revoke_session(sid):
+    if sid:
+        _revoke(f"sid:{sid}", datetime.utcnow() + _refresh_lifetime())
+
+
+def revoke_user_tokens(user_id):
+    _revoke(f"user:{user_id}", datetime.utcnow() + _refresh_lifetime())
+
+
+def claim_refresh(payload):
+    # Marks a refresh token used; False if it already was (a replay).
+    db.session.add(RevokedToken(key=f"used:{payload['jti']}", revoked_at=time.time(),
+                                expires_at=_expiry(payload)))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    _maybe_purge()
+    return True
+
+
+def purge_expired(batch_size=1000, max_batches=None):
+    # Deletes expired rows in batches of primary keys, one commit each.
+    count = batches = 0
+    while max_batches is None or batches < max_batches:
+        keys = [row.key for row in db.session.query(RevokedToken.key)
+                .filter(RevokedToken.expires_at < datetime.utcnow()).limit(batch_size)]
+        if not keys:
+            break
+        RevokedToken.query.filter(RevokedToken.key.in_(keys)).delete(synchronize_session=False)
+        db.session.commit()
+        count += len(keys)
+        batches += 1
+    return count
+
+
+def _maybe_purge():
+    # At most once per TOKEN_PURGE_SECONDS per process, a few batches at a
+    # time, so the table stays bounded without a scheduled job.
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < app.config.get("TOKEN_PURGE_SECONDS", 600):
+        return
+    _last_purge = now
+    try:
+        purge_expired(max_batches=5)
+    except Exception:
+        db.session.rollback()
+        logger.exception("purging expired token revocations failed")
+
+
+tokens_cli = AppGroup("tokens", help="Token revocations")
+
+
+@tokens_cli.command("purge")
+def purge_command():
+    click.echo(f"deleted {purge_expired()} expired revocations")
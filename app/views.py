@@ -0,0 +1,134 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import app
+from app.models import db, ProductViews
+
+logger = logging.getLogger(__name__)
+
+
+# Buffered ProductViews writer.
+# record() only appends to an in-memory queue, so a product page view costs
+# a lock and a deque append. A background thread drains the queue with one
+# bulk INSERT whenever VIEW_FLUSH_BATCH events are waiting or every
+# VIEW_FLUSH_SECONDS. When the queue is full (the database is slow or down)
+# new events are dropped and counted rather than slowing the request down;
+# a batch the database rejects is counted as failed and discarded.
+class ViewTracker:
+
+    def __init__(self, max_queue=50000, batch_size=500, interval=2.0):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def record(self, product_id, user_id=None):
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return False
+            self._queue.append({"product_id": product_id, "user_id": user_id,
+                                "viewed_at": datetime.utcnow()})
+            self.recorded += 1
+            full = len(self._queue) >= self.batch_size
+        if self._thread is None:
+            self.start()
+        if full:
+            self._wake.set()
+        return True
+
+    def _take(self):
+        with self._lock:
+            count = min(len(self._queue), self.batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def flush(self):
+        # Writes everything queued so far; returns the number of rows.
+        total = 0
+        while True:
+            rows = self._take()
+            if not rows:
+                return total
+            began = time.perf_counter()
+            try:
+                db.session.execute(insert(ProductViews), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self.failed += len(rows)
+                raise
+            with self._lock:
+                self.written += len(rows)
+                self.batches += 1
+                self.last_flush_ms = round((time.perf_counter() - began) * 1000, 2)
+            total += len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("product view flush failed")
+                finally:
+                    db.session.remove()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="product-view-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        with app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("final product view flush failed")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._queue),
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+                "last_flush_ms": self.last_flush_ms,
+            }
+
+
+view_tracker = ViewTracker(
+    max_queue=app.config.get("VIEW_QUEUE_MAX", 50000),
+    batch_size=app.config.get("VIEW_FLUSH_BATCH", 500),
+    interval=app.config.get("VIEW_FLUSH_SECONDS", 2.0),
+)
+
+
+def track_view(product_id, user_id=None):
+    if app.config.get("VIEW_TRACKING_ENABLED", True):
+        view_tracker.record(product_id, user_id)
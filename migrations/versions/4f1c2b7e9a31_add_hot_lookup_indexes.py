@@ -0,0 +1,88 @@
+"""add hot lookup indexes
+
+Revision ID: 4f1c2b7e9a31
+Revises: cc1f9b213fb5
+Create Date: 2026-10-18 10:12:41.208331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2b7e9a31'
+down_revision = 'cc1f9b213fb5'
+branch_labels = None
+depends_on = None
+
+
+def _merge_duplicate_cart_lines():
+    # The unique (user_id, product_id) constraint cannot be created while a
+    # user still has several lines for one product: fold them into the oldest.
+    conn = op.get_bind()
+    dupes = conn.execute(sa.text(
+        "SELECT user_id, product_id, MIN(id), SUM(quantity) FROM cart "
+        "GROUP BY user_id, product_id HAVING COUNT(*) > 1"
+    )).fetchall()
+    for user_id, product_id, keep_id, quantity in dupes:
+        conn.execute(sa.text("UPDATE cart SET quantity = :q WHERE id = :id"),
+                     {"q": quantity, "id": keep_id})
+        conn.execute(sa.text(
+            "DELETE FROM cart WHERE user_id = :u AND product_id = :p AND id <> :id"
+        ), {"u": user_id, "p": product_id, "id": keep_id})
+
+
+def upgrade():
+    _merge_duplicate_cart_lines()
+
+    with op.batch_alter_table('cart', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_cart_user_product', ['user_id', 'product_id'])
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_category_id', ['category', 'id'], unique=False)
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_user_created', ['user_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('inventory', schema=None) as batch_op:
+        batch_op.create_index('ix_inventory_product', ['product_id'], unique=False)
+
+    with op.batch_alter_table('order_items', schema=None) as batch_op:
+        batch_op.create_index('ix_order_items_order', ['order_id'], unique=False)
+
+    with op.batch_alter_table('runner_assignments', schema=None) as batch_op:
+        batch_op.create_index('ix_runner_assignments_runner_status', ['runner_id', 'status'], unique=False)
+        batch_op.create_index('ix_runner_assignments_order', ['order_id'], unique=False)
+
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.create_index('ix_payments_order', ['order_id'], unique=False)
+
+    with op.batch_alter_table('order_status_history', schema=None) as batch_op:
+        batch_op.create_index('ix_order_status_history_order_changed', ['order_id', 'changed_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order_status_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_status_history_order_changed')
+
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_index('ix_payments_order')
+
+    with op.batch_alter_table('runner_assignments', schema=None) as batch_op:
+        batch_op.drop_index('ix_runner_assignments_order')
+        batch_op.drop_index('ix_runner_assignments_runner_status')
+
+    with op.batch_alter_table('order_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_items_order')
+
+    with op.batch_alter_table('inventory', schema=None) as batch_op:
+        batch_op.drop_index('ix_inventory_product')
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_user_created')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_category_id')
+
+    with op.batch_alter_table('cart', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_cart_user_product', type_='unique')
@@ -0,0 +1,76 @@
+# Benchmark for the batch dispatch solver (app/dispatch.py) on synthetic
+# orders and runners: solve time and total distance of the optimal
+# assignment versus greedy "nearest free runner, oldest order first".
+#
+#   python scripts/bench_dispatch.py --orders 300 --runners 200
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.dispatch import INFEASIBLE, build_cost_matrix, solve_assignment  # noqa: E402
+
+
+def greedy(distance, max_km):
+    taken, pairs = set(), []
+    for i, row in enumerate(distance):
+        best = min((d, j) for j, d in enumerate(row) if j not in taken) if len(taken) < len(row) else None
+        if best and best[0] <= max_km:
+            taken.add(best[1])
+            pairs.append((i, best[1]))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch dispatch solver benchmark")
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--runners", type=int, default=200)
+    parser.add_argument("--radius-km", type=float, default=12.0)
+    parser.add_argument("--max-km", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, default=11)
+    opts = parser.parse_args()
+
+    rng = random.Random(opts.seed)
+    centre = (18.5204, 73.8567)
+    spread = opts.radius_km / 111.0
+    now = datetime.utcnow()
+
+    def point():
+        return (centre[0] + rng.uniform(-spread, spread), centre[1] + rng.uniform(-spread, spread))
+
+    orders = sorted(({"order_id": i, "point": point(),
+                      "created_at": now - timedelta(minutes=rng.uniform(0, 45))}
+                     for i in range(opts.orders)), key=lambda o: o["created_at"])
+    runners = [{"runner_id": j, "name": f"r{j}", "point": point()} for j in range(opts.runners)]
+
+    t0 = time.perf_counter()
+    cost, distance = build_cost_matrix(orders, runners, now, speed_kmh=20.0, wait_weight=0.0, max_km=opts.max_km)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    pairs = [(i, j) for i, j in solve_assignment(cost) if cost[i][j] < INFEASIBLE]
+    solve_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    gpairs = greedy(distance, opts.max_km)
+    greedy_ms = (time.perf_counter() - t0) * 1000
+
+    optimal_km = sum(distance[i][j] for i, j in pairs)
+    greedy_km = sum(distance[i][j] for i, j in gpairs)
+    print(f"orders={opts.orders} runners={opts.runners} cost matrix={build_ms:.1f}ms")
+    print(f"optimal  matched={len(pairs):4d} total={optimal_km:9.1f}km "
+          f"avg={optimal_km / max(len(pairs), 1):5.2f}km solve={solve_ms:8.1f}ms")
+    print(f"greedy   matched={len(gpairs):4d} total={greedy_km:9.1f}km "
+          f"avg={greedy_km / max(len(gpairs), 1):5.2f}km solve={greedy_ms:8.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# Benchmark for password hashing (app/passwords.py): login verifications
+# per second on one core for each hash method, then the throughput of the
+# process pool under concurrent logins.
+#
+#   python scripts/bench_password_hash.py --workers 4 --clients 16
+#   python scripts/bench_password_hash.py --method pbkdf2:sha256:600000 --method scrypt:16384:8:1
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+from app import app  # noqa: E402
+from app import passwords  # noqa: E402
+
+DEFAULT_METHODS = ["scrypt:32768:8:1", "scrypt:16384:8:1", "pbkdf2:sha256:600000", "pbkdf2:sha256:260000"]
+
+
+def per_core(method, seconds):
+    stored = generate_password_hash("correct horse battery staple", method)
+    count, began = 0, time.perf_counter()
+    while time.perf_counter() - began < seconds:
+        check_password_hash(stored, "correct horse battery staple")
+        count += 1
+    return count / (time.perf_counter() - began)
+
+
+def pooled(method, workers, clients, logins):
+    app.config.update(PASSWORD_HASH_METHOD=method, PASSWORD_HASH_WORKERS=workers,
+                      PASSWORD_HASH_QUEUE=clients, PASSWORD_HASH_TIMEOUT=60)
+    stored = generate_password_hash("correct horse battery staple", method)
+    passwords.check_password(stored, "correct horse battery staple")  # start the pool
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: passwords.check_password(stored, "correct horse battery staple"),
+                                range(logins)))
+    assert all(results)
+    return logins / (time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing benchmark")
+    parser.add_argument("--method", action="append", help="werkzeug hash method (repeatable)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Per-core measurement time per method.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent login threads.")
+    parser.add_argument("--logins", type=int, default=200)
+    opts = parser.parse_args()
+
+    methods = opts.method or DEFAULT_METHODS
+    print(f"cpus={os.cpu_count()} workers={opts.workers} clients={opts.clients}")
+    for method in methods:
+        single = per_core(method, opts.seconds)
+        line = f"{method:24s} {single:8.1f} logins/s/core  {1000 / single:7.1f}ms each"
+        if opts.workers:
+            line += f"   pool {pooled(method, opts.workers, opts.clients, opts.logins):8.1f} logins/s"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
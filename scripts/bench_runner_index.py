@@ -0,0 +1,91 @@
+# Benchmark for the in-memory runner location index (app/geo.py): places N
+# simulated runners around a city and times k-nearest lookups against a
+# brute-force scan, checking both return the same runners.
+#
+#   python scripts/bench_runner_index.py --runners 10000 --queries 5000 --k 5
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.geo import RunnerLocationIndex, haversine_km  # noqa: E402
+
+
+def brute_force(points, lat, lon, k):
+    return sorted((haversine_km(lat, lon, plat, plon), rid) for rid, (plat, plon) in points.items())[:k]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="k-nearest runner lookup benchmark")
+    parser.add_argument("--runners", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius-km", type=float, default=25.0, help="spread of runners around the centre")
+    parser.add_argument("--cell-deg", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    opts = parser.parse_args()
+
+    rng = random.Random(opts.seed)
+    centre = (18.5204, 73.8567)  # Pune
+    spread = opts.radius_km / 111.0
+
+    def random_point():
+        return (centre[0] + rng.uniform(-spread, spread), centre[1] + rng.uniform(-spread, spread))
+
+    index = RunnerLocationIndex(cell_deg=opts.cell_deg)
+    points = {}
+    began = time.perf_counter()
+    for rid in range(1, opts.runners + 1):
+        lat, lon = random_point()
+        points[rid] = (lat, lon)
+        index.update(rid, lat, lon, dirty=False)
+    build_s = time.perf_counter() - began
+
+    queries = [random_point() for _ in range(opts.queries)]
+    timings = []
+    for lat, lon in queries:
+        t0 = time.perf_counter()
+        index.nearest(lat, lon, k=opts.k)
+        timings.append((time.perf_counter() - t0) * 1e6)
+
+    brute = []
+    mismatches = 0
+    for lat, lon in queries[:200]:
+        t0 = time.perf_counter()
+        expected = brute_force(points, lat, lon, opts.k)
+        brute.append((time.perf_counter() - t0) * 1e6)
+        got = index.nearest(lat, lon, k=opts.k)
+        if [rid for _, rid in got] != [rid for _, rid in expected]:
+            mismatches += 1
+
+    # Ping ingestion rate (moves within a few hundred metres)
+    t0 = time.perf_counter()
+    for _ in range(opts.queries):
+        rid = rng.randint(1, opts.runners)
+        lat, lon = points[rid]
+        index.update(rid, lat + rng.uniform(-0.003, 0.003), lon + rng.uniform(-0.003, 0.003))
+    ping_us = (time.perf_counter() - t0) * 1e6 / opts.queries
+
+    print(f"runners={opts.runners} k={opts.k} cell={opts.cell_deg}deg build={build_s * 1000:.1f}ms")
+    print(f"index lookup  mean={statistics.mean(timings):8.1f}us  p50={percentile(timings, 50):8.1f}us  "
+          f"p99={percentile(timings, 99):8.1f}us")
+    print(f"brute force   mean={statistics.mean(brute):8.1f}us  (200 queries)")
+    print(f"ping update   mean={ping_us:8.1f}us")
+    print(f"result mismatches vs brute force: {mismatches}/200")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# Fails (exit 1) when one of the hot route queries would fall back to a full
+# table scan. Runs EXPLAIN QUERY PLAN on SQLite and EXPLAIN on MySQL against
+# the database in DATABASE_URL:
+#
+#   DATABASE_URL=sqlite:///instance/db.sqlite3 python scripts/check_query_plans.py
+#   python scripts/check_query_plans.py --create-schema   # scratch DB, no migrations
+#
+# Add a check here whenever a route gets a new hot query.
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import app  # noqa: E402
+from app.models import (  # noqa: E402
+    db, Cart, Inventory, Order, OrderStatusHistory, OrderSummary, Product, RunnerAssignments
+)
+from app.delivery_boy import runner_engagement_query  # noqa: E402
+
+OPEN_STATUSES = ['assigned', 'picked_up']
+
+# (route, table that must not be scanned, query)
+CHECKS = [
+    ("cart.add_to_cart / update_cart_quantity", "cart",
+     lambda: Cart.query.filter_by(user_id=1, product_id=1)),
+    ("cart.view_cart", "cart",
+     lambda: Cart.query.filter_by(user_id=1)),
+    ("product.filter_products_by_category", "product",
+     lambda: Product.query.with_entities(Product.id).filter(Product.category == "Fruits").order_by(Product.id)),
+    ("order.get_user_orders", "order_summary",
+     lambda: OrderSummary.query.filter_by(user_id=1)
+     .order_by(OrderSummary.created_at.desc(), OrderSummary.order_id.desc()).limit(20)),
+    ("order.get_all_orders", "order",
+     lambda: Order.query.order_by(Order.created_at.desc(), Order.id.desc())),
+    ("order.get_all_orders ?status", "order",
+     lambda: Order.query.filter(Order.status.in_(["Pending", "Paid"]))
+     .order_by(Order.created_at.desc(), Order.id.desc())),
+    ("runner.assign_runner", "runner_assignments",
+     lambda: RunnerAssignments.query.filter_by(runner_id=1)
+     .filter(RunnerAssignments.status.in_(OPEN_STATUSES))),
+    ("runner.list_runners", "runner_assignments",
+     lambda: runner_engagement_query()[0]),
+    ("runner.get_runner_history", "runner_assignments",
+     lambda: RunnerAssignments.query.filter_by(runner_id=1)
+     .order_by(RunnerAssignments.assigned_at.desc(), RunnerAssignments.id.desc())),
+    ("order.history", "order_status_history",
+     lambda: OrderStatusHistory.query.filter_by(order_id=1).order_by(OrderStatusHistory.changed_at)),
+    ("order.place_order / change_status (inventory)", "inventory",
+     lambda: Inventory.query.filter_by(product_id=1)),
+]
+
+
+def _compile(query, dialect):
+    return str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def full_scans_sqlite(conn, sql, table):
+    # detail looks like "SCAN cart" (bad) vs "SEARCH cart USING INDEX ..." or
+    # "SCAN cart USING COVERING INDEX ..." (index order walk, fine)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).fetchall()
+    details = [row[-1] for row in rows]
+    bad = [d for d in details
+           if d.split(" ")[0] == "SCAN"
+           and d.split(" ")[1].strip('"`') == table
+           and "INDEX" not in d]
+    return bad, details
+
+
+def full_scans_mysql(conn, sql, table):
+    result = conn.exec_driver_sql("EXPLAIN " + sql)
+    cols = list(result.keys())
+    rows = [dict(zip(cols, r)) for r in result.fetchall()]
+    bad = [r for r in rows if r.get("table") == table and r.get("type") == "ALL"]
+    return bad, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a hot route query does a full table scan")
+    parser.add_argument("--create-schema", action="store_true",
+                        help="create the tables from the models first (scratch databases only)")
+    opts = parser.parse_args()
+
+    failures = 0
+    with app.app_context():
+        if opts.create_schema:
+            db.create_all()
+        dialect = db.engine.dialect
+        if dialect.name == "sqlite":
+            explain = full_scans_sqlite
+        elif dialect.name == "mysql":
+            explain = full_scans_mysql
+        else:
+            print(f"unsupported dialect {dialect.name}")
+            return 2
+
+        with db.engine.connect() as conn:
+            for route, table, build in CHECKS:
+                sql = _compile(build(), dialect)
+                bad, plan = explain(conn, sql, table)
+                status = "FULL SCAN" if bad else "ok"
+                print(f"[{status:>9}] {route}")
+                if bad:
+                    failures += 1
+                    print(f"            {sql}")
+                    for line in plan:
+                        print(f"            {line}")
+
+    if failures:
+        print(f"{failures} route(s) fall back to a full table scan")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
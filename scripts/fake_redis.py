@@ -0,0 +1,211 @@
+# Minimal in-memory server speaking the Redis protocol (RESP), for running the
+# shared cache backend locally without a real Redis:
+#
+#   python scripts/fake_redis.py --port 6390
+#   CACHE_BACKEND=redis CACHE_REDIS_URL=redis://localhost:6390/0 flask run
+#
+# Supports the commands app/cache.py uses: PING GET MGET SET (EX/NX) DEL
+# INCR INCRBY EXPIRE SCAN PUBLISH SUBSCRIBE AUTH SELECT WATCH UNWATCH MULTI
+# EXEC DISCARD.
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+def read_command(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("client went away")
+    if line[:1] != b"*":
+        # inline command (e.g. typed into telnet)
+        return line.split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int(reader.readline()[1:-2])
+        args.append(reader.read(size + 2)[:-2])
+    return args
+
+
+class Store:
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.versions = {}  # key -> write count, for WATCH
+        self.subscribers = {}
+        self.lock = threading.RLock()
+
+    def touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _alive(self, key):
+        exp = self.expires.get(key)
+        if exp is not None and exp < time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(items):
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    store = None
+
+    def handle(self):
+        self.watched = {}
+        self.queued = None  # commands after MULTI
+        while True:
+            try:
+                cmd = read_command(self.rfile)
+            except (ConnectionError, OSError):
+                return
+            if not isinstance(cmd, list) or not cmd:
+                return
+            name = cmd[0].decode().upper()
+            args = cmd[1:]
+            if name == "SUBSCRIBE":
+                self.subscribe(args)
+                return
+            try:
+                reply = self.transaction(name, args)
+                if reply is None:
+                    reply = self.dispatch(name, args)
+            except Exception as e:  # report like Redis does, keep the connection
+                reply = b"-ERR %s\r\n" % str(e).encode()
+            self.wfile.write(reply)
+            self.wfile.flush()
+
+    def transaction(self, name, args):
+        # -> reply for transaction commands and queued ones, None otherwise
+        s = self.store
+        if name == "WATCH":
+            with s.lock:
+                for key in args:
+                    s._alive(key)
+                    self.watched[key] = s.versions.get(key, 0)
+            return b"+OK\r\n"
+        if name == "UNWATCH":
+            self.watched = {}
+            return b"+OK\r\n"
+        if name == "MULTI":
+            self.queued = []
+            return b"+OK\r\n"
+        if name == "DISCARD":
+            self.queued, self.watched = None, {}
+            return b"+OK\r\n"
+        if name == "EXEC":
+            queued, watched, self.queued, self.watched = self.queued, self.watched, None, {}
+            if queued is None:
+                return b"-ERR EXEC without MULTI\r\n"
+            with s.lock:
+                for key in watched:
+                    s._alive(key)
+                if any(s.versions.get(key, 0) != version for key, version in watched.items()):
+                    return b"*-1\r\n"
+                return _array([self.dispatch(n, a) for n, a in queued])
+        if self.queued is not None:
+            self.queued.append((name, args))
+            return b"+QUEUED\r\n"
+        return None
+
+    def dispatch(self, name, args):
+        s = self.store
+        with s.lock:
+            if name in ("PING", "AUTH", "SELECT"):
+                return b"+OK\r\n" if name != "PING" else b"+PONG\r\n"
+            if name == "GET":
+                return _bulk(s.data[args[0]] if s._alive(args[0]) else None)
+            if name == "MGET":
+                return _array([_bulk(s.data[k] if s._alive(k) else None) for k in args])
+            if name == "SET":
+                key, value, opts = args[0], args[1], [a.decode().upper() for a in args[2:]]
+                if "NX" in opts and s._alive(key):
+                    return b"$-1\r\n"
+                s.data[key] = value
+                s.touch(key)
+                s.expires.pop(key, None)
+                if "EX" in opts:
+                    s.expires[key] = time.monotonic() + int(opts[opts.index("EX") + 1])
+                return b"+OK\r\n"
+            if name == "DEL":
+                for k in args:
+                    s.touch(k)
+                removed = sum(1 for k in args if s._alive(k) and s.data.pop(k, None) is not None)
+                return b":%d\r\n" % removed
+            if name in ("INCR", "INCRBY"):
+                amount = int(args[1]) if name == "INCRBY" else 1
+                value = (int(s.data[args[0]]) if s._alive(args[0]) else 0) + amount
+                s.data[args[0]] = str(value).encode()
+                s.touch(args[0])
+                return b":%d\r\n" % value
+            if name == "EXPIRE":
+                if not s._alive(args[0]):
+                    return b":0\r\n"
+                s.expires[args[0]] = time.monotonic() + int(args[1])
+                s.touch(args[0])
+                return b":1\r\n"
+            if name == "SCAN":
+                pattern = b"*"
+                if b"MATCH" in [a.upper() for a in args]:
+                    pattern = args[[a.upper() for a in args].index(b"MATCH") + 1]
+                keys = [k for k in list(s.data) if s._alive(k) and fnmatch.fnmatchcase(k.decode(), pattern.decode())]
+                return _array([_bulk(b"0"), _array([_bulk(k) for k in keys])])
+            if name == "PUBLISH":
+                channel, message = args
+                subs = list(s.subscribers.get(channel, ()))
+        if name == "PUBLISH":
+            payload = _array([_bulk(b"message"), _bulk(channel), _bulk(message)])
+            for wfile in subs:
+                try:
+                    wfile.write(payload)
+                    wfile.flush()
+                except OSError:
+                    pass
+            return b":%d\r\n" % len(subs)
+        raise ValueError(f"unknown command '{name}'")
+
+    def subscribe(self, channels):
+        with self.store.lock:
+            for channel in channels:
+                self.store.subscribers.setdefault(channel, []).append(self.wfile)
+        for i, channel in enumerate(channels, 1):
+            self.wfile.write(_array([_bulk(b"subscribe"), _bulk(channel), b":%d\r\n" % i]))
+        self.wfile.flush()
+        try:
+            while self.rfile.read(1):
+                pass
+        finally:
+            with self.store.lock:
+                for channel in channels:
+                    self.store.subscribers.get(channel, []).remove(self.wfile)
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(host="127.0.0.1", port=6390):
+    Handler.store = Store()
+    server = Server((host, port), Handler)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory Redis protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    opts = parser.parse_args()
+    print(f"fake redis listening on {opts.host}:{opts.port}")
+    serve(opts.host, opts.port).serve_forever()
@@ -0,0 +1,118 @@
+# Concurrency harness for checkout: N threads try to buy the same SKU at
+# once and the run fails (exit 1) if more units were sold than were in stock.
+#
+#   python scripts/stock_contention.py --threads 50 --stock 20 --qty 1
+#   DATABASE_URL=mysql+pymysql://user:pw@localhost/grocery_test \
+#       python scripts/stock_contention.py --threads 200 --stock 50
+#
+# Without DATABASE_URL a throwaway SQLite file is used. Point DATABASE_URL
+# only at a scratch database: the script creates its own users and product.
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+if "DATABASE_URL" not in os.environ:
+    _tmp = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from app import app  # noqa: E402
+from app.models import db, Address, Cart, Inventory, Order, OrderItems, Product, User  # noqa: E402
+from app.stock import stock_metrics  # noqa: E402
+
+
+def setup(threads, stock, qty):
+    run = uuid.uuid4().hex[:8]
+    db.create_all()
+    product = Product(name=f"contended-{run}", price=1.0, unit="1 pc", stock=stock, category="Test")
+    db.session.add(product)
+    db.session.flush()
+    db.session.add(Inventory(product_id=product.id, stock=stock))
+
+    tokens = []
+    for i in range(threads):
+        user = User(name=f"buyer {i}", email=f"{run}-{i}@example.test",
+                    phone=f"{run}{i:06d}"[:15], password="x")
+        db.session.add(user)
+        db.session.flush()
+        address = Address(user_id=user.id, street="1 Main St", city="Pune", state="MH",
+                          zip_code="411001", country="India")
+        db.session.add(address)
+        db.session.add(Cart(user_id=user.id, product_id=product.id, quantity=qty))
+        db.session.flush()
+        tokens.append((create_access_token(identity=str(user.id)), address.id))
+    db.session.commit()
+    return product.id, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent checkout oversell check")
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=20)
+    parser.add_argument("--qty", type=int, default=1, help="units per checkout")
+    opts = parser.parse_args()
+
+    with app.app_context():
+        product_id, tokens = setup(opts.threads, opts.stock, opts.qty)
+
+    client = app.test_client()
+    start = threading.Barrier(opts.threads)
+    statuses = [None] * opts.threads
+
+    def buy(i, token, address_id):
+        start.wait()
+        resp = client.post("/orders/place",
+                           json={"address_id": address_id, "payment_mode": "cod"},
+                           headers={"Authorization": f"Bearer {token}"})
+        statuses[i] = resp.status_code
+
+    workers = [threading.Thread(target=buy, args=(i, t, a)) for i, (t, a) in enumerate(tokens)]
+    began = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - began
+
+    with app.app_context():
+        final = db.session.get(Product, product_id).stock
+        inventory = Inventory.query.filter_by(product_id=product_id).first().stock
+        sold = (db.session.query(db.func.coalesce(db.func.sum(OrderItems.quantity), 0))
+                .join(Order, Order.id == OrderItems.order_id)
+                .filter(OrderItems.product_id == product_id).scalar())
+
+    ok = statuses.count(201)
+    print(f"{opts.threads} checkouts in {elapsed:.2f}s: {ok} placed, "
+          f"{statuses.count(400)} out of stock, {statuses.count(409)} gave up, "
+          f"other={[s for s in statuses if s not in (201, 400, 409)]}")
+    print(f"stock {opts.stock} -> {final} (inventory {inventory}), units sold {sold}")
+    print(f"metrics {stock_metrics.snapshot()}")
+
+    expected_sold = min(opts.stock // opts.qty, opts.threads) * opts.qty
+    failures = []
+    if final < 0 or inventory < 0:
+        failures.append("stock went negative")
+    if sold + final != opts.stock:
+        failures.append(f"sold ({sold}) + remaining ({final}) != initial stock ({opts.stock})")
+    if sold > opts.stock:
+        failures.append("oversold")
+    if ok * opts.qty != sold:
+        failures.append("placed orders and sold units disagree")
+    if sold < expected_sold and statuses.count(409) == 0:
+        failures.append(f"undersold: {sold} < {expected_sold} without any give-ups")
+    for f in failures:
+        print("FAIL:", f)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())